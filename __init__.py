@@ -18,6 +18,8 @@ gDict = defaultdict(lambda: [])
 queueDB = {}
 formatDB = {}
 replyDB = {}
+driveDB = {}  # uid -> rclone folder being browsed and the files picked from it
+archiveDB = {}  # uid -> downloaded archive and the videos found in it
 
 VIDEO_EXTENSIONS = ["mkv", "mp4", "webm", "ts", "wav", "mov"]
 AUDIO_EXTENSIONS = ["aac", "ac3", "eac3", "m4a", "mka", "thd", "dts", "mp3"]
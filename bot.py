@@ -19,6 +19,15 @@ from plugins_merge.start import start_handler as merge_start
 from plugins_merge.commands import handle_files as merge_handle_files
 from plugins_merge.thumb import save_thumbnail as merge_save_thumb
 from plugins_merge.thumb import delete_thumbnail as merge_delete_thumb
+from plugins_merge.metadataEditor import metaEditor as merge_metadata
+from plugins_merge.mergeRemote import driveBrowse as merge_drive
+from plugins_merge.bulkQueue import bulkEnqueue as merge_bulk
+from plugins_merge.mergeArchive import archiveInput as merge_archive
+from helpers.archive import isArchive
+from plugins_rename.metadata import handle_metadata as rename_metadata
+from helpers.downloader import schedulePrefetch
+from helpers.utils import UserSettings
+from __init__ import queueDB
 
 # user_modes keeps track of each user's chosen mode
 user_modes = {}
@@ -137,7 +146,16 @@ async def file_router(client, message):
     if mode == "rename":
         await rename_file(client, message)
     elif mode == "merge":
+        if message.document and isArchive(message.document.file_name):
+            # season packs are merged straight out of the archive
+            await merge_archive(client, message)
+            return
         await merge_handle_files(client, message)
+        queue = queueDB.get(user_id, {})
+        if any(message.id in (queue.get(k) or []) for k in ("videos", "audios", "subtitles")):
+            # start fetching while the user is still building the queue
+            user = UserSettings(user_id, message.from_user.first_name)
+            schedulePrefetch(client, user_id, message, user.merge_mode)
     else:
         await message.reply_text("❗ Please choose a mode first using /mode.")
 
@@ -162,4 +180,34 @@ async def delete_thumb_handler(client, message):
     elif mode == "merge":
         await merge_delete_thumb(client, message)
 
+@bot.on_message(filters.command(["metadata"]) & filters.private)
+async def metadata_handler(client, message):
+    user_id = message.from_user.id
+    mode = user_modes.get(user_id, "rename")
+
+    if mode == "rename":
+        await rename_metadata(client, message)
+    elif mode == "merge":
+        await merge_metadata(client, message)
+
+@bot.on_message(filters.command(["drive"]) & filters.private)
+async def drive_handler(client, message):
+    user_id = message.from_user.id
+    mode = user_modes.get(user_id, "rename")
+
+    if mode == "merge":
+        await merge_drive(client, message)
+    else:
+        await message.reply_text("❗ Drive inputs are only for merge mode, switch with /mode.")
+
+@bot.on_message(filters.command(["bulk"]) & filters.private)
+async def bulk_handler(client, message):
+    user_id = message.from_user.id
+    mode = user_modes.get(user_id, "rename")
+
+    if mode == "merge":
+        await merge_bulk(client, message)
+    else:
+        await message.reply_text("❗ Bulk queueing is only for merge mode, switch with /mode.")
+
 bot.run()
@@ -36,7 +36,18 @@ class Config(object):
     GDRIVE_FOLDER_ID = os.environ.get("GDRIVE_FOLDER_ID","root")
     USER_SESSION_STRING = os.environ.get("USER_SESSION_STRING")
     IS_PREMIUM = False
-    MODES = ["video-video", "video-audio", "video-subtitle","extract-streams"]
+    MODES = ["video-video", "video-audio", "video-subtitle","extract-streams", "video-audio-subtitle", "compress", "trim"]
+    MAX_JOB_DOWNLOADS = int(os.environ.get("MAX_JOB_DOWNLOADS", 4))
+    MAX_GLOBAL_DOWNLOADS = int(os.environ.get("MAX_GLOBAL_DOWNLOADS", 12))
+    STREAM_MERGE = os.environ.get("STREAM_MERGE", "False").lower() == "true"
+    COMPRESS_ENCODER = os.environ.get("COMPRESS_ENCODER", "libx264")
+    COMPRESS_CRF = os.environ.get("COMPRESS_CRF", "23")
+    COMPRESS_PRESET = os.environ.get("COMPRESS_PRESET", "medium")
+    COMPRESS_AUDIO = os.environ.get("COMPRESS_AUDIO", "copy")
+    # auto, pyav or ffprobe, auto uses PyAV when it is installed
+    PROBE_BACKEND = os.environ.get("PROBE_BACKEND", "auto").lower()
+    # containers a merge can be written to at once, first one is the main output
+    OUTPUT_FORMATS = ["mkv", "mkv+mp4", "mp4"]
 
 
 class Txt(object):
@@ -0,0 +1,156 @@
+import asyncio
+import re
+
+from __init__ import (AUDIO_EXTENSIONS, LOGGER, SUBTITLE_EXTENSIONS,
+                      VIDEO_EXTENSIONS)
+
+# 7z lists a compressed tarball as the one tar inside it, not its members
+ARCHIVE_EXTENSIONS = ["zip", "7z", "rar", "tar"]
+# chunks of the next member decompressed while the current one is merged
+READ_AHEAD_CHUNKS = 64
+
+
+def isArchive(file_name: str):
+    return bool(file_name) and file_name.rsplit(".", 1)[-1].lower() in ARCHIVE_EXTENSIONS
+
+
+def naturalKey(name: str):
+    """
+    Sort key that puts `Ep 2` before `Ep 10`.
+    """
+    return [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", name.lower())]
+
+
+async def listArchive(path: str):
+    """
+    Lists the files of an archive with `7z`, which reads zip, 7z, rar and tar.
+
+    returns: List of `{"Path": .., "Size": ..}`, or `None` if it can't be read.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "7z",
+        "l",
+        "-slt",
+        "-ba",
+        path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.warning(stderr.decode().strip())
+        return None
+    entries = []
+    # one "Key = value" block per member, blank line between blocks
+    for block in stdout.decode(errors="replace").split("\n\n"):
+        fields = dict(
+            [line.split(" = ", 1) for line in block.splitlines() if " = " in line]
+        )
+        if "Path" not in fields or fields.get("Folder") == "+":
+            continue
+        size = fields.get("Size", "")
+        entries.append({"Path": fields["Path"], "Size": int(size) if size.isdigit() else 0})
+    return entries
+
+
+def classifyMembers(entries: list):
+    """
+    Sorts the files of an archive by what they can be merged as.
+
+    returns: dict with `videos`, `audios`, `subtitles` and `other`, each in natural order.
+    """
+    kinds = {"videos": [], "audios": [], "subtitles": [], "other": []}
+    for e in entries:
+        ext = e["Path"].rsplit(".", 1)[-1].lower()
+        if ext in VIDEO_EXTENSIONS:
+            kinds["videos"].append(e)
+        elif ext in SUBTITLE_EXTENSIONS:
+            kinds["subtitles"].append(e)
+        elif ext in AUDIO_EXTENSIONS:
+            kinds["audios"].append(e)
+        else:
+            kinds["other"].append(e)
+    for members in kinds.values():
+        members.sort(key=lambda e: naturalKey(e["Path"]))
+    return kinds
+
+
+async def archiveCat(archive: str, member: str, chunk_size: int = 1024 * 1024):
+    """
+    Decompresses one member of an archive to a pipe, nothing is written to disk.
+
+    returns: Async iterator of chunks of the member.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "7z",
+        "e",
+        "-so",
+        # member names are paths, not wildcards
+        "-spd",
+        archive,
+        member,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            chunk = await process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        await process.wait()
+        if process.returncode != 0:
+            raise Exception(f"7z e {member} exited with {process.returncode}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+class ArchiveReader:
+    """
+    Reads the members of an archive in order and starts decompressing
+    the next one as soon as the current one is opened.
+    """
+
+    def __init__(self, archive: str, members: list):
+        self._archive = archive
+        self._members = members
+        self._started = {}
+
+    def _start(self, n: int):
+        if n >= len(self._members) or n in self._started:
+            return
+        queue = asyncio.Queue(maxsize=READ_AHEAD_CHUNKS)
+
+        async def _fill():
+            try:
+                async for chunk in archiveCat(self._archive, self._members[n]):
+                    await queue.put(chunk)
+                await queue.put(None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                await queue.put(err)
+
+        self._started[n] = (queue, asyncio.create_task(_fill()))
+
+    async def chunks(self, n: int):
+        self._start(n)
+        self._start(n + 1)
+        queue, task = self._started[n]
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            task.cancel()
+
+    def close(self):
+        for _, task in self._started.values():
+            task.cancel()
+        self._started = {}
@@ -0,0 +1,103 @@
+import numpy as np
+from __init__ import LOGGER
+
+from helpers.ffmpeg_runner import runFFmpeg
+from helpers.probe import probeDuration
+
+SYNC_RATE = 8000  # mono samples per second, plenty for speech and music onsets
+WINDOW = 20  # seconds of the new track compared per window
+MAX_LAG = 3  # largest offset looked for, either way, in seconds
+WINDOWS_AT = [0.2, 0.5, 0.8]  # where the windows sit, as a share of the duration
+MIN_SCORE = 0.3  # normalized correlation peak needed to trust a window
+MAX_SPREAD = 0.04  # windows further apart than this (seconds) don't agree
+
+
+async def decodeWindow(path: str, start: float, length: float, stream: str = "a:0"):
+    """
+    Decodes a short part of an audio stream to low-rate mono samples.
+
+    returns: float32 numpy array, empty if nothing could be decoded.
+    """
+    decodecmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-v",
+        "error",
+        "-ss",
+        f"{max(start, 0):.3f}",
+        "-t",
+        f"{length:.3f}",
+        "-i",
+        path,
+        "-map",
+        f"0:{stream}",
+        "-ac",
+        "1",
+        "-ar",
+        str(SYNC_RATE),
+        "-f",
+        "f32le",
+        "pipe:1",
+    ]
+    result = await runFFmpeg(decodecmd, timeout=120, capture_stdout=True)
+    if not result.ok:
+        return np.zeros(0, dtype=np.float32)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def crossCorrelate(reference: np.ndarray, track: np.ndarray):
+    """
+    Slides `track` over `reference` with FFTs.
+
+    returns: `(shift, score)`, where `reference[shift:]` lines up best with
+    `track`, and `score` is the normalized peak from 0 to 1.
+    """
+    reference = reference - reference.mean()
+    track = track - track.mean()
+    n = 1 << int(len(reference) + len(track) - 1).bit_length()
+    corr = np.fft.irfft(
+        np.fft.rfft(reference, n) * np.conj(np.fft.rfft(track, n)), n
+    )[: len(reference) - len(track) + 1]
+    # energy of every reference slice the track was compared with
+    energy = np.cumsum(np.concatenate(([0.0], reference.astype(np.float64) ** 2)))
+    energy = energy[len(track) :] - energy[: len(corr)]
+    norm = np.sqrt(np.maximum(energy, 1e-12) * float(np.dot(track, track)))
+    scores = corr / np.maximum(norm, 1e-12)
+    shift = int(np.argmax(scores))
+    return shift, float(scores[shift])
+
+
+async def findOffset(videoPath: str, audioPath: str):
+    """
+    Finds how far an external audio track is off the video's own audio by
+    comparing a few short windows, so it costs seconds even on long files.
+
+    Parameters:
+    - `videoPath`: Video whose first audio track is the reference.
+    - `audioPath`: The new audio track.
+
+    returns: Seconds to pass to `-itsoffset` for `audioPath`, `0` if the
+    windows don't agree on an offset.
+    """
+    duration = await probeDuration(videoPath)
+    if duration < WINDOW + 2 * MAX_LAG:
+        return 0
+    lags = []
+    for at in WINDOWS_AT:
+        start = max(duration * at, MAX_LAG)
+        start = min(start, duration - WINDOW - MAX_LAG)
+        reference = await decodeWindow(videoPath, start - MAX_LAG, WINDOW + 2 * MAX_LAG)
+        track = await decodeWindow(audioPath, start, WINDOW)
+        if len(track) < SYNC_RATE or len(reference) <= len(track):
+            continue
+        shift, score = crossCorrelate(reference, track)
+        LOGGER.info(f"Sync window at {start:.0f}s: shift {shift} score {score:.2f}")
+        if score >= MIN_SCORE:
+            # a track that is late by d matches the reference d seconds earlier
+            lags.append(shift / SYNC_RATE - MAX_LAG)
+    if len(lags) < 2 or max(lags) - min(lags) > MAX_SPREAD:
+        LOGGER.info(f"No agreed offset for {audioPath}: {lags}")
+        return 0
+    offset = round(float(np.median(lags)), 3)
+    LOGGER.info(f"Offset of {audioPath}: {offset}s")
+    return offset
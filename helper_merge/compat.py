@@ -0,0 +1,143 @@
+import subprocess
+from collections import Counter
+from functools import lru_cache
+
+from __init__ import LOGGER
+
+from helpers.probe import probeStreams
+
+# probe codec name -> encoders to try, in order of preference
+VIDEO_ENCODERS = {
+    "h264": ["libx264", "h264"],
+    "hevc": ["libx265", "hevc"],
+    "vp9": ["libvpx-vp9"],
+    "vp8": ["libvpx"],
+    "av1": ["libsvtav1", "libaom-av1"],
+    "mpeg4": ["mpeg4"],
+}
+AUDIO_ENCODERS = {
+    "aac": ["aac", "libfdk_aac"],
+    "ac3": ["ac3"],
+    "eac3": ["eac3"],
+    "opus": ["libopus", "opus"],
+    "vorbis": ["libvorbis"],
+    "mp3": ["libmp3lame"],
+    "flac": ["flac"],
+}
+
+
+@lru_cache(maxsize=1)
+def getEncoders():
+    """
+    Lists the encoders of the installed ffmpeg build, only asked once.
+
+    returns: frozenset of encoder names.
+    """
+    try:
+        out = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True
+        ).stdout
+    except Exception as e:
+        LOGGER.warning(f"Unable to list encoders: {e}")
+        return frozenset()
+    encoders = set()
+    started = False
+    for line in out.splitlines():
+        if line.strip().startswith("------"):
+            started = True
+            continue
+        parts = line.split()
+        if started and len(parts) >= 2:
+            encoders.add(parts[1])
+    return frozenset(encoders)
+
+
+def pickEncoder(codec_name: str, table: dict):
+    """
+    returns: First encoder for `codec_name` the ffmpeg build has, else `None`.
+    """
+    encoders = getEncoders()
+    for enc in table.get(codec_name, []):
+        if enc in encoders:
+            return enc
+    return None
+
+
+async def streamSignature(path: str):
+    """
+    The stream parameters that have to match for a concat with `-c copy`.
+    """
+    streams = await probeStreams(path)
+    video = [s for s in streams if s["codec_type"] == "video"]
+    audio = [s for s in streams if s["codec_type"] == "audio"]
+    sig = {"audio_streams": len(audio)}
+    if video:
+        v = video[0]
+        sig.update(
+            {
+                "vcodec": v.get("codec_name"),
+                "width": v.get("width"),
+                "height": v.get("height"),
+                "pix_fmt": v.get("pix_fmt"),
+                # time bases may differ, the concat demuxer rescales them
+                "frame_rate": v.get("r_frame_rate"),
+            }
+        )
+    if audio:
+        a = audio[0]
+        sig.update(
+            {
+                "acodec": a.get("codec_name"),
+                "sample_rate": a.get("sample_rate"),
+                "channels": a.get("channels"),
+                "channel_layout": a.get("channel_layout"),
+            }
+        )
+    return sig
+
+
+async def planConcat(paths: list):
+    """
+    Picks the cheapest way to concat the inputs.
+
+    Parameters:
+    - `paths`: Input video paths in merge order.
+
+    returns: dict with
+    - `mode`: `copy` (all inputs match), `normalize` (re-encode only the
+      `outliers` to match `target`) or `filter` (re-encode everything).
+    - `target`: Signature of the majority of the inputs.
+    - `outliers`: Indexes of inputs that don't match `target`.
+    - `vencoder` / `aencoder`: Encoders to use when re-encoding.
+    """
+    sigs = [await streamSignature(p) for p in paths]
+    keys = [tuple(sorted(s.items())) for s in sigs]
+    majority, count = Counter(keys).most_common(1)[0]
+    target = dict(majority)
+    outliers = [n for n, k in enumerate(keys) if k != majority]
+    plan = {
+        "mode": "copy",
+        "target": target,
+        "outliers": outliers,
+        "vencoder": pickEncoder(target.get("vcodec"), VIDEO_ENCODERS),
+        "aencoder": pickEncoder(target.get("acodec"), AUDIO_ENCODERS),
+        "all_audio": all(["acodec" in s for s in sigs]),
+    }
+    if not outliers:
+        return plan
+    normalizable = (
+        count * 2 > len(paths)
+        and plan["vencoder"] is not None
+        and (plan["aencoder"] is not None or "acodec" not in target)
+        # track layouts can't be fixed by re-encoding one file
+        and all(sigs[n]["audio_streams"] == target["audio_streams"] for n in outliers)
+        and all("vcodec" in sigs[n] for n in outliers)
+    )
+    if normalizable:
+        plan["mode"] = "normalize"
+    else:
+        plan["mode"] = "filter"
+        plan["vencoder"] = plan["vencoder"] or pickEncoder("h264", VIDEO_ENCODERS)
+        plan["aencoder"] = plan["aencoder"] or pickEncoder("aac", AUDIO_ENCODERS)
+    LOGGER.info(f"Concat plan: {plan['mode']} outliers={outliers}")
+    return plan
@@ -66,6 +66,25 @@ async def getThumb(uid):
     return res["thumbid"]
 
 
+async def saveMetadata(uid, meta):
+    try:
+        Database.mergebot.metadata.insert_one({"_id": uid, "meta": meta})
+    except DuplicateKeyError:
+        Database.mergebot.metadata.replace_one({"_id": uid}, {"meta": meta})
+
+
+async def delMetadata(uid):
+    Database.mergebot.metadata.delete_many({"_id": uid})
+    return True
+
+
+async def getMetadata(uid):
+    res = Database.mergebot.metadata.find_one({"_id": uid})
+    if res is None:
+        return None
+    return res["meta"]
+
+
 async def deleteUser(uid):
     Database.mergebot.mergeSettings.delete_many({"_id": uid})
 
@@ -101,7 +120,7 @@ def getUserMergeSettings(uid: int):
         return None
 
 
-def setUserMergeSettings(uid: int, name: str, mode, edit_metadata, banned, allowed, thumbnail):
+def setUserMergeSettings(uid: int, name: str, mode, edit_metadata, banned, allowed, thumbnail, fit_to_size=False, output_formats="mkv", audio_sync=False):
     modes = Config.MODES
     if uid:
         try:
@@ -112,6 +131,9 @@ def setUserMergeSettings(uid: int, name: str, mode, edit_metadata, banned, allow
                     "user_settings": {
                         "merge_mode": mode,
                         "edit_metadata": edit_metadata,
+                        "fit_to_size": fit_to_size,
+                        "output_formats": output_formats,
+                        "audio_sync": audio_sync,
                     },
                     "isAllowed": allowed,
                     "isBanned": banned,
@@ -127,6 +149,9 @@ def setUserMergeSettings(uid: int, name: str, mode, edit_metadata, banned, allow
                     "user_settings": {
                         "merge_mode": mode,
                         "edit_metadata": edit_metadata,
+                        "fit_to_size": fit_to_size,
+                        "output_formats": output_formats,
+                        "audio_sync": audio_sync,
                     },
                     "isAllowed": allowed,
                     "isBanned": banned,
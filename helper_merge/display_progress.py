@@ -31,6 +31,8 @@ class Progress:
         self._client = client
         self._mess = mess
         self._cancelled = False
+        self._last_edit = 0
+        self._last_position = None
 
     @property
     def is_cancelled(self):
@@ -115,6 +117,90 @@ class Progress:
             except Exception as ou:
                 logger.info(ou)
 
+    async def progress_for_ffmpeg(self, done, total, speed, ud_type, start):
+        """
+        Same status message as `progress_for_pyrogram`, for ffmpeg's
+        `-progress` output: `done` and `total` are seconds of media and
+        `speed` is how many media seconds ffmpeg does per second.
+        """
+        chat_id = self._mess.chat.id
+        mes_id = self._mess.id
+        now = time.time()
+        if now - self._last_edit < EDIT_SLEEP_TIME_OUT and done < total:
+            return
+        self._last_edit = now
+        reply_markup = InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "⛔ Cancel ⛔",
+                        callback_data=(
+                            f"gUPcancel/{chat_id}/{mes_id}/{self._from_user}"
+                        ).encode("UTF-8"),
+                    )
+                ]
+            ]
+        )
+        percentage = done * 100 / total
+        progress = "\n<code>[{0}{1}] {2}%</code>\n".format(
+            "".join([FINISHED_PROGRESS_STR for i in range(math.floor(percentage / 5))]),
+            "".join(
+                [UN_FINISHED_PROGRESS_STR for i in range(20 - math.floor(percentage / 5))]
+            ),
+            round(percentage, 2),
+        )
+        eta = TimeFormatter(milliseconds=(total - done) / speed * 1000) if speed else ""
+        tmp = progress + (
+            "\n**⌧ Total 🎞:**` 〚{0}〛`\n**⌧ Done ✅ :**` 〚{1}〛`\n**⌧ Speed 📊 :** ` 〚{2}x〛`\n**⌧ ETA 🔃 :**` 〚{3}〛`\n**⌧ Elapsed ⏱ :**` 〚{4}〛`".format(
+                TimeFormatter(milliseconds=total * 1000),
+                TimeFormatter(milliseconds=done * 1000) or "0 s",
+                speed,
+                eta or "0 s",
+                TimeFormatter(milliseconds=(now - start) * 1000) or "0 s",
+            )
+        )
+        try:
+            await self._mess.edit_text(
+                text="{}\n {}".format(ud_type, tmp), reply_markup=reply_markup
+            )
+        except FloodWait as fd:
+            logger.warning(f"{fd}")
+        except Exception as ou:
+            logger.info(ou)
+
+    async def waiting_for_slot(self, position, kind, ud_type):
+        """
+        Shows where the job is in the governor's queue, only when that changes.
+        """
+        if position == self._last_position:
+            return
+        self._last_position = position
+        chat_id = self._mess.chat.id
+        mes_id = self._mess.id
+        reply_markup = InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "⛔ Cancel ⛔",
+                        callback_data=(
+                            f"gUPcancel/{chat_id}/{mes_id}/{self._from_user}"
+                        ).encode("UTF-8"),
+                    )
+                ]
+            ]
+        )
+        work = "encoding" if kind == "cpu" else "processing"
+        try:
+            await self._mess.edit_text(
+                text=f"{ud_type}\n\n⏳ Server is busy, waiting for a free {work} slot\n"
+                f"**⌧ Position in queue 🔢 :**` 〚{position}〛`",
+                reply_markup=reply_markup,
+            )
+        except FloodWait as fd:
+            logger.warning(f"{fd}")
+        except Exception as ou:
+            logger.info(ou)
+
 
 def humanbytes(size):
     # https://stackoverflow.com/a/49361727/4723940
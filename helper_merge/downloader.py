@@ -0,0 +1,240 @@
+import asyncio
+import os
+import shutil
+import time
+
+from __init__ import AUDIO_EXTENSIONS, LOGGER, SUBTITLE_EXTENSIONS, queueDB
+from config import Config
+from pyrogram import Client
+from pyrogram.types import CallbackQuery, Message
+
+from helpers.display_progress import Progress
+from helpers.keyframes import rememberFile
+from helpers.media_info import rememberMedia
+
+# Shared by every job, so a burst of merges can't open hundreds of transfers.
+_global_slots = asyncio.Semaphore(Config.MAX_GLOBAL_DOWNLOADS)
+prefetchDB = {}  # uid -> {message_id: download task}
+_user_slots = {}  # uid -> Semaphore, one user's queue can't take every global slot
+
+
+def queuePath(user_id: int, m: Message):
+    """
+    Where a queued message is saved, shared by the prefetcher and every merge mode.
+    """
+    media = m.video or m.document or m.audio
+    ext = media.file_name.rsplit(sep=".")[-1].lower() if media.file_name else "mkv"
+    if ext in SUBTITLE_EXTENSIONS and m.video is None:
+        tmpFileName = "sub." + ext
+    elif ext in AUDIO_EXTENSIONS and m.video is None:
+        tmpFileName = "audio." + ext
+    else:
+        # fix for filename with single quote(') in name
+        tmpFileName = "vid.mkv"
+    return f"downloads/{str(user_id)}/{str(m.id)}/{tmpFileName}"
+
+
+def uniqueMedia(messages: list):
+    """
+    Drops messages whose media was already seen earlier in the list.
+
+    Parameters:
+    - `messages`: List of `Message` objects, in merge order.
+
+    returns: Same list without repeated `file_unique_id`s, order kept.
+    """
+    seen = set()
+    result = []
+    for m in messages:
+        media = m.video or m.document or m.audio
+        if media is None:
+            continue
+        if media.file_unique_id in seen:
+            LOGGER.info(f"Skipping duplicate: {media.file_name}")
+            continue
+        seen.add(media.file_unique_id)
+        result.append(m)
+    return result
+
+
+class AggregateProgress:
+    """
+    Folds the progress of several parallel downloads into one status message.
+    """
+
+    def __init__(self, prog: Progress, total_size: int, count: int, ud_type: str):
+        self._prog = prog
+        self._total = total_size
+        self._count = count
+        self._ud_type = ud_type
+        self._start = time.time()
+        self._done = {}
+        self._finished = 0
+        self._last_edit = 0
+
+    def finished(self):
+        self._finished += 1
+
+    async def update(self, current, total, key):
+        self._done[key] = current or 0
+        if not self._total or not sum(self._done.values()):
+            # no sizes from telegram or nothing yet, the bar would divide by zero
+            return
+        now = time.time()
+        # every download calls this, keep edits to about one per second
+        if now - self._last_edit < 1 and current != total:
+            return
+        self._last_edit = now
+        await self._prog.progress_for_pyrogram(
+            sum(self._done.values()),
+            self._total,
+            self._ud_type,
+            self._start,
+            f"\n**Downloaded: {self._finished}/{self._count}**",
+        )
+
+
+async def downloadAll(c: Client, cb: CallbackQuery, items: list):
+    """
+    Downloads all inputs of a job at once.
+
+    Parameters:
+    - `items`: List of `(Message, file_name)` tuples.
+
+    returns: List of downloaded paths in the same order as `items`,
+    `None` in place of files that failed.
+    """
+    job_slots = asyncio.Semaphore(Config.MAX_JOB_DOWNLOADS)
+    total_size = 0
+    for m, _ in items:
+        media = m.video or m.document or m.audio
+        total_size += media.file_size or 0
+    prog = AggregateProgress(
+        Progress(cb.from_user.id, c, cb.message),
+        total_size,
+        len(items),
+        f"🚀 Downloading {len(items)} files",
+    )
+
+    async def _download(m: Message, file_name: str):
+        media = m.video or m.document or m.audio
+        path = await collectPrefetch(cb.from_user.id, m.id)
+        if path is not None:
+            LOGGER.info(f"Using prefetched ... {media.file_name}")
+            rememberFile(path, media.file_unique_id)
+            rememberMedia(path, media)
+            prog.finished()
+            await prog.update(media.file_size, media.file_size, m.id)
+            return path
+        async with job_slots, _global_slots:
+            LOGGER.info(f"📥 Starting Download of ... {media.file_name}")
+            try:
+                path = await c.download_media(
+                    message=media,
+                    file_name=file_name,
+                    progress=prog.update,
+                    progress_args=(m.id,),
+                )
+            except Exception as downloadErr:
+                LOGGER.warning(f"Failed to download Error: {downloadErr}")
+                return None
+        prog.finished()
+        if path is None:
+            # cancelled, stop_transmission makes download_media return None
+            return None
+        rememberFile(path, media.file_unique_id)
+        rememberMedia(path, media)
+        LOGGER.info(f"Downloaded Sucessfully ... {media.file_name}")
+        return path
+
+    return await asyncio.gather(*[_download(m, f) for m, f in items])
+
+
+def _consumed(user_id: int, m: Message, merge_mode: int):
+    # only what the job will download anyway is worth fetching early
+    if merge_mode == 1:
+        # streamed jobs read the inputs straight from Telegram
+        return not Config.STREAM_MERGE
+    if merge_mode == 4:
+        return False
+    # every other mode works on the first video only
+    videos = (queueDB.get(user_id) or {}).get("videos") or []
+    return m.id not in videos or videos[0] == m.id
+
+
+def schedulePrefetch(c: Client, user_id: int, m: Message, merge_mode: int):
+    """
+    Starts downloading a queued message in the background, if the user's
+    merge mode will use it.
+    """
+    if not _consumed(user_id, m, merge_mode):
+        return
+    tasks = prefetchDB.setdefault(user_id, {})
+    if m.id in tasks:
+        return
+    tasks[m.id] = asyncio.create_task(_prefetch(c, user_id, m, queuePath(user_id, m)))
+
+
+async def _prefetch(c: Client, user_id: int, m: Message, file_name: str):
+    media = m.video or m.document or m.audio
+    user_slots = _user_slots.setdefault(
+        user_id, asyncio.Semaphore(Config.MAX_JOB_DOWNLOADS)
+    )
+    async with user_slots, _global_slots:
+        LOGGER.info(f"Prefetching ... {media.file_name}")
+        try:
+            return await c.download_media(message=media, file_name=file_name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as downloadErr:
+            LOGGER.warning(f"Prefetch failed: {downloadErr}")
+            return None
+
+
+async def collectPrefetch(user_id: int, message_id: int):
+    """
+    Waits for a prefetched download to finish.
+
+    returns: Path of the file, or `None` if it wasn't prefetched or failed.
+    """
+    task = prefetchDB.get(user_id, {}).pop(message_id, None)
+    if task is None:
+        return None
+    try:
+        return await task
+    except asyncio.CancelledError:
+        return None
+
+
+def cancelPrefetch(user_id: int, message_id: int = None):
+    """
+    Stops prefetching and removes what was already downloaded.
+
+    Parameters:
+    - `message_id`: Message to drop, or `None` to drop the whole queue.
+    """
+    tasks = prefetchDB.get(user_id, {})
+    ids = list(tasks.keys()) if message_id is None else [message_id]
+    for mid in ids:
+        task = tasks.pop(mid, None)
+        if task is None:
+            continue
+        task.cancel()
+        shutil.rmtree(f"downloads/{str(user_id)}/{str(mid)}", ignore_errors=True)
+
+
+def prefetchedSize(user_id: int):
+    """
+    returns: Bytes the user's prefetches already wrote to disk, finished or not.
+    """
+    size = 0
+    for mid in prefetchDB.get(user_id, {}):
+        folder = f"downloads/{str(user_id)}/{str(mid)}"
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            try:
+                size += os.path.getsize(f"{folder}/{name}")
+            except OSError:
+                continue
+    return size
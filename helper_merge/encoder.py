@@ -0,0 +1,325 @@
+import asyncio
+import os
+import time
+
+from __init__ import LOGGER
+from config import Config
+from pyrogram import Client
+from pyrogram.types import CallbackQuery
+
+from helpers.display_progress import Progress
+from helpers.ffmpeg_helper import MergeVideo
+from helpers.ffmpeg_runner import WATCH_INTERVAL, runFFmpeg
+from helpers.governor import slotCount
+from helpers.keyframes import keyframeIndex
+from helpers.metadata import metadataArgs
+from helpers.workspace import jobDir
+
+
+async def _encode_chunk(src: str, dst: str, encoder: str, crf: str, preset: str):
+    # one ffmpeg per chunk on a single thread, as many at once as there are encode slots
+    encodecmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-i",
+        src,
+        "-map",
+        "0:v:0",
+        "-c:v",
+        encoder,
+        "-crf",
+        crf,
+        "-preset",
+        preset,
+        "-threads",
+        "1",
+        dst,
+    ]
+    return await runFFmpeg(encodecmd)
+
+
+async def splitAtKeyframes(filePath: str, out_dir: str, chunks: int, duration: float):
+    """
+    Cuts the video stream into about `chunks` pieces with stream copy.
+    The segment muxer only cuts on keyframes, so every piece starts with one.
+    With a keyframe index the pieces are balanced by bytes instead of time,
+    which is closer to how long they take to encode.
+
+    returns: Paths of the pieces in order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    segment = ["-segment_time", str(max(duration / chunks, 1))]
+    index = await keyframeIndex(filePath)
+    if index is not None and len(index) > chunks and min(index.offsets) >= 0:
+        step = index.offsets[-1] / chunks
+        times = []
+        for n in range(1, len(index)):
+            if index.offsets[n] >= step * (len(times) + 1):
+                times.append(f"{max(index.times[n] - 0.001, 0):.3f}")
+        if times:
+            segment = ["-segment_times", ",".join(times)]
+    splitcmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-i",
+        filePath,
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        "-f",
+        "segment",
+        *segment,
+        "-reset_timestamps",
+        "1",
+        f"{out_dir}/chunk%04d.mkv",
+    ]
+    result = await runFFmpeg(splitcmd)
+    if not result.ok:
+        return []
+    return sorted(
+        [f"{out_dir}/{f}" for f in os.listdir(out_dir) if f.startswith("chunk")]
+    )
+
+
+async def CompressVideo(
+    c: Client,
+    cb: CallbackQuery,
+    filePath: str,
+    duration: float,
+    user_id: int,
+    job_id: int = None,
+    metadata: dict = None,
+):
+    """
+    Re-encodes a video on every available core. The video is split at keyframes,
+    the chunks are encoded one ffmpeg per core and joined back with `MergeVideo`,
+    then the original audio and subtitles are muxed in.
+
+    Parameters:
+    - `filePath`: Path to Video file.
+    - `duration`: Duration of the video in seconds.
+    - `user_id`: To get parent directory.
+    - `job_id`: Job whose workspace gets the output.
+    - `metadata`: Saved metadata of the user, written in the final mux.
+
+    returns: Path of the re-encoded video, or `None` on failure.
+    """
+    work_dir = f"{jobDir(user_id, job_id)}/compress"
+    # as many chunks at once as the governor has encode slots
+    workers = slotCount("cpu")
+    # a few chunks per core keeps every core busy until the end
+    chunks = max(1, min(workers * 3, int(duration // 10)))
+    await cb.message.edit(f"✂️ Splitting video into {chunks} chunks ...")
+    parts = await splitAtKeyframes(filePath, f"{work_dir}/src", chunks, duration)
+    if not parts:
+        return None
+    os.makedirs(f"{work_dir}/enc", exist_ok=True)
+    sizes = [os.path.getsize(p) for p in parts]
+    total = sum(sizes)
+    done = 0
+    prog = Progress(user_id, c, cb.message)
+    c_time = time.time()
+    slots = asyncio.Semaphore(workers)
+    encoded = [os.path.abspath(f"{work_dir}/enc/{os.path.basename(p)}") for p in parts]
+
+    async def _encode(n: int):
+        async with slots:
+            result = await _encode_chunk(
+                parts[n],
+                encoded[n],
+                Config.COMPRESS_ENCODER,
+                Config.COMPRESS_CRF,
+                Config.COMPRESS_PRESET,
+            )
+        return n, result
+
+    jobs = [asyncio.ensure_future(_encode(n)) for n in range(len(parts))]
+    pending = set(jobs)
+    finished = 0
+    while pending:
+        # wake up now and then, a cancel mustn't wait for a chunk to finish
+        ready, pending = await asyncio.wait(
+            pending, timeout=WATCH_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+        )
+        failed = any([not job.result()[1].ok for job in ready])
+        if failed or prog.is_cancelled:
+            # cancelling runFFmpeg kills the chunk's ffmpeg process group
+            for other in pending:
+                other.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            return None
+        for job in ready:
+            n, result = job.result()
+            finished += 1
+            done += sizes[n]
+        if ready:
+            await prog.progress_for_pyrogram(
+                done,
+                total,
+                f"🗜 Encoding on {workers} cores",
+                c_time,
+                f"\n**Encoded: {finished}/{len(parts)} chunks**",
+            )
+    input_ = f"{work_dir}/input.txt"
+    with open(input_, "w") as _list:
+        _list.write("\n".join([f"file '{p}'" for p in encoded]))
+    joined = await MergeVideo(
+        input_file=input_,
+        user_id=user_id,
+        message=cb.message,
+        format_="mkv",
+        job_id=job_id,
+    )
+    if joined is None:
+        return None
+    output = f"{jobDir(user_id, job_id)}/[@yashoswalyo]_compressed.mkv"
+    muxcmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-i",
+        joined,
+        "-i",
+        filePath,
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a?",
+        "-map",
+        "1:s?",
+        "-c:v",
+        "copy",
+        "-c:a",
+        Config.COMPRESS_AUDIO,
+        "-c:s",
+        "copy",
+        *metadataArgs(metadata),
+        output,
+    ]
+    LOGGER.info(muxcmd)
+    result = await runFFmpeg(
+        muxcmd, duration=duration, progress=prog, ud_type="🎵 Muxing audio back in"
+    )
+    if result.ok and os.path.lexists(output):
+        return output
+    else:
+        return None
+
+
+# copied subtitle tracks without a bitrate, images take far more than text
+SUBTITLE_BPS = {"hdmv_pgs_subtitle": 64000, "dvd_subtitle": 64000, "dvb_subtitle": 64000}
+
+
+def copiedStreamBytes(probe: dict, duration: float):
+    """
+    Bytes of the audio and subtitle tracks, which are copied as they are
+    when a video is fitted to size.
+
+    Parameters:
+    - `probe`: `probeMedia` result of the video.
+    - `duration`: Duration of the video in seconds.
+
+    returns: Size in bytes, estimated from the bitrates where mkv didn't
+    write the exact count.
+    """
+    total = 0
+    for stream in probe.get("streams", []):
+        kind = stream.get("codec_type")
+        if kind not in ("audio", "subtitle"):
+            continue
+        tags = stream.get("tags", {})
+        if str(tags.get("NUMBER_OF_BYTES", "")).isdigit():
+            total += int(tags["NUMBER_OF_BYTES"])
+            continue
+        # mkv keeps the bitrate in the BPS tag instead
+        bps = str(stream.get("bit_rate") or tags.get("BPS") or "")
+        if not bps.isdigit():
+            bps = 192000 if kind == "audio" else SUBTITLE_BPS.get(stream.get("codec_name"), 1000)
+        total += int(bps) * duration / 8
+    return int(total)
+
+
+def videoBitrateBudget(copied_bytes: int, duration: float, max_size: int):
+    """
+    Video bitrate that makes the whole file fit in `max_size`, after the
+    copied tracks take their share.
+
+    Parameters:
+    - `copied_bytes`: Size of the audio and subtitles, see `copiedStreamBytes`.
+    - `duration`: Duration of the video in seconds.
+    - `max_size`: Target size in bytes.
+
+    returns: Bitrate in bits/s, or `None` if the copied tracks alone don't leave room.
+    """
+    # leave some room for the container and rate control overshoot
+    video_bits = max_size * 8 * 0.97 - copied_bytes * 8
+    video_bps = int(video_bits / max(duration, 1))
+    if video_bps < 100000:
+        return None
+    return video_bps
+
+
+async def FitToSize(
+    cb: CallbackQuery, filePath: str, duration: float, copied_bytes: int, max_size: int
+):
+    """
+    Re-encodes only the video stream with two-pass x264 so the file lands
+    just under `max_size`. Audio and subtitles are copied.
+
+    Parameters:
+    - `filePath`: Path to Video file.
+    - `duration`: Duration of the video in seconds, as the caller knows it.
+    - `copied_bytes`: Size of the audio and subtitles, see `copiedStreamBytes`.
+    - `max_size`: Target size in bytes.
+
+    returns: Path of the re-encoded video, or `None` on failure.
+    """
+    bitrate = videoBitrateBudget(copied_bytes, duration, max_size)
+    if bitrate is None:
+        LOGGER.info("Audio and subtitles alone are over the size budget")
+        return None
+    stem, ext = os.path.splitext(filePath)
+    output = f"{stem}.fit{ext}"
+    passlog = f"{stem}.2pass"
+    common = [
+        "-map",
+        "0:v:0",
+        "-c:v",
+        "libx264",
+        "-b:v",
+        str(bitrate),
+        "-preset",
+        Config.COMPRESS_PRESET,
+        "-passlogfile",
+        passlog,
+    ]
+    # first pass only needs the video, skip decoding anything else
+    passes = [
+        ["-pass", "1", "-an", "-sn", "-f", "null", os.devnull],
+        ["-map", "0:a?", "-map", "0:s?", "-c:a", "copy", "-c:s", "copy", "-pass", "2", output],
+    ]
+    for n, args in enumerate(passes, start=1):
+        await cb.message.edit(
+            f"🎯 Encoding to fit {round(max_size / 1024**3, 2)}GB, pass {n}/2 ..."
+        )
+        encodecmd = ["ffmpeg", "-hide_banner", "-y", "-i", filePath, *common, *args]
+        LOGGER.info(encodecmd)
+        result = await runFFmpeg(
+            encodecmd,
+            duration=duration,
+            progress=Progress(cb.from_user.id, cb._client, cb.message),
+            ud_type=f"🎯 Encoding to fit, pass {n}/2",
+        )
+        if not result.ok:
+            return None
+    for f in os.listdir(os.path.dirname(passlog) or "."):
+        if f.startswith(os.path.basename(passlog)):
+            os.remove(os.path.join(os.path.dirname(passlog), f))
+    if os.path.getsize(output) > max_size:
+        LOGGER.info(f"Fit to size overshot: {os.path.getsize(output)} bytes")
+        os.remove(output)
+        return None
+    return output
@@ -1,26 +1,130 @@
 import asyncio
-import subprocess
 import shutil
 import os
 import time
-import ffmpeg
+from pyrogram import Client
 from pyrogram.types import CallbackQuery
 from config import Config
 from pyrogram.types import Message
 from __init__ import LOGGER
+from helpers.archive import ArchiveReader
+from helpers.compat import VIDEO_ENCODERS, pickEncoder, streamSignature
+from helpers.display_progress import Progress
+from helpers.ffmpeg_runner import killGroup, runFFmpeg, spawn
+from helpers.governor import governed, prioritized, reportQueue
+from helpers.keyframes import cachedKeyframeIndex, keyframeIndex
+from helpers.downloader import AggregateProgress
+from helpers.metadata import metadataArgs
+from helpers.probe import probeDuration, probeMedia, probeStreams
+from helpers.rclone_upload import rcloneCat
 from helpers.utils import get_path_size
+from helpers.workspace import jobDir
 
 
-async def MergeVideo(input_file: str, user_id: int, message: Message, format_: str):
+# fragmented mp4 plays while it downloads and needs no second pass to move the moov
+MP4_STREAMING = "+frag_keyframe+empty_moov+default_base_moof"
+# bitstream filters that put the parameter sets in band, for joining
+# stream-copied and re-encoded pieces of the same video
+ANNEXB_FILTERS = {"h264": "h264_mp4toannexb", "hevc": "hevc_mp4toannexb"}
+# enough of a file to find where its moov box is
+MP4_HEAD_SIZE = 64 * 1024
+# container -> muxer name and tee options for outputs besides the main one
+TEE_FORMATS = {
+    "mkv": "f=matroska",
+    # mp4 can't take srt/ass tracks as they are, leave them to the mkv
+    "mp4": f"f=mp4:movflags={MP4_STREAMING}:select=\\'v,a\\'",
+    "webm": "f=webm:select=\\'v,a\\'",
+}
+
+
+def teeOutputs(output_vid: str, extra_formats: list = None):
+    """
+    returns: Paths of the extra containers written next to `output_vid`.
+    """
+    stem = os.path.splitext(output_vid)[0]
+    return [f"{stem}.{ext}" for ext in (extra_formats or []) if f"{stem}.{ext}" != output_vid]
+
+
+async def completeTeeOutputs(output_vid: str, extra_formats: list = None):
+    """
+    Extra containers of a finished tee mux that hold the whole video. A slave
+    with `onfail=ignore` that failed midway leaves a truncated file behind,
+    so each one has to last about as long as the main output.
+
+    returns: Paths of the usable extra outputs, the others are removed.
+    """
+    duration = await probeDuration(output_vid)
+    complete = []
+    for path in teeOutputs(output_vid, extra_formats):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        # containers round the last frame differently, allow a little slack
+        if await probeDuration(path) < duration - max(2, duration * 0.01):
+            LOGGER.warning(f"{path} stopped before the end of the merge, dropping it")
+            os.remove(path)
+            continue
+        complete.append(path)
+    return complete
+
+
+def _progress(user_id: int, message: Message):
+    # status message progress for runFFmpeg, its cancel button stops ffmpeg
+    if message is None:
+        return None
+    return Progress(user_id, message._client, message)
+
+
+async def _total_duration(paths: list):
+    return sum([await probeDuration(p) for p in paths])
+
+
+def _input_maps(output_vid: str, extra_formats: list = None):
+    # a lone mp4 takes only video and audio, same as the tee's mp4 slave selects
+    if output_vid.endswith(".mp4") and not teeOutputs(output_vid, extra_formats):
+        return ["-map", "0:v", "-map", "0:a?"]
+    return ["-map", "0"]
+
+
+def _output_args(output_vid: str, extra_formats: list = None):
+    # one muxer per container reading the same packets, inputs are read once
+    extras = teeOutputs(output_vid, extra_formats)
+    if not extras:
+        if output_vid.endswith(".mp4"):
+            return ["-sn", "-movflags", MP4_STREAMING, output_vid]
+        return [output_vid]
+    main_ext = os.path.splitext(output_vid)[1][1:]
+    slaves = [f"[{TEE_FORMATS.get(main_ext, 'f=matroska')}]{output_vid}"]
+    for path in extras:
+        # a container that can't take the streams must not fail the main one
+        slaves.append(
+            f"[{TEE_FORMATS[os.path.splitext(path)[1][1:]]}:onfail=ignore]{path}"
+        )
+    return ["-f", "tee", "|".join(slaves)]
+
+
+async def MergeVideo(
+    input_file: str,
+    user_id: int,
+    message: Message,
+    format_: str,
+    subtitle_file: str = None,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
     """
     This is for Merging Videos Together!
     :param `input_file`: input.txt file's location.
     :param `user_id`: Pass user_id as integer.
     :param `message`: Pass Editable Message for Showing FFmpeg Progress.
     :param `format_`: Pass File Extension.
+    :param `subtitle_file`: Optional subtitle already timed for the merged video, muxed in the same pass.
+    :param `job_id`: Job whose workspace gets the output.
+    :param `metadata`: Saved metadata of the user, written in the same pass.
+    :param `extra_formats`: Other containers to write from the same pass, see `teeOutputs`.
     :return: This will return Merged Video File Path
     """
-    output_vid = f"downloads/{str(user_id)}/[@yashoswalyo].{format_.lower()}"
+    output_vid = f"{jobDir(user_id, job_id)}/[@yashoswalyo].{format_.lower()}"
     file_generator_command = [
         "ffmpeg",
         "-f",
@@ -29,18 +133,41 @@ async def MergeVideo(input_file: str, user_id: int, message: Message, format_: s
         "0",
         "-i",
         input_file,
-        "-map",
-        "0",
+    ]
+    if subtitle_file is not None:
+        file_generator_command += ["-i", subtitle_file]
+    file_generator_command += _input_maps(output_vid, extra_formats)
+    if subtitle_file is not None:
+        first_file = None
+        with open(input_file, "r") as _list:
+            for line in _list:
+                if line.startswith("file "):
+                    first_file = line.strip()[6:-1]
+                    break
+        subTrack = len(await probeStreams(first_file, "subtitle"))
+        file_generator_command += [
+            "-map",
+            "1:s",
+            f"-metadata:s:s:{subTrack}",
+            f"title=Track {subTrack+1} - tg@yashoswalyo",
+        ]
+    file_generator_command += [
         "-c",
         "copy",
-        output_vid,
+        *metadataArgs(metadata),
+        *_output_args(output_vid, extra_formats),
     ]
-    process = None
+    with open(input_file, "r") as _list:
+        inputs = [line.strip()[6:-1] for line in _list if line.startswith("file ")]
+    base = os.path.dirname(input_file)
+    duration = await _total_duration([os.path.join(base, p) for p in inputs])
+    await message.edit("Merging Video Now ...\n\nPlease Keep Patience ...")
     try:
-        process = await asyncio.create_subprocess_exec(
-            *file_generator_command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        result = await runFFmpeg(
+            file_generator_command,
+            duration=duration,
+            progress=_progress(user_id, message),
+            ud_type="🔀 Merging videos",
         )
     except NotImplementedError:
         await message.edit(
@@ -48,19 +175,452 @@ async def MergeVideo(input_file: str, user_id: int, message: Message, format_: s
         )
         await asyncio.sleep(10)
         return None
-    await message.edit("Merging Video Now ...\n\nPlease Keep Patience ...")
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
-    LOGGER.info(e_response)
-    LOGGER.info(t_response)
-    if os.path.lexists(output_vid):
+    if result.ok and os.path.lexists(output_vid):
+        return output_vid
+    else:
+        return None
+
+
+async def MergeVideoStream(
+    c: Client,
+    messages: list,
+    user_id: int,
+    message: Message,
+    format_: str,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
+    """
+    Merges videos while they are still downloading, without saving the inputs.
+    Each input is remuxed to MPEG-TS on the fly and written into a FIFO that the
+    concat demuxer reads in order, so only the output ever touches the disk.
+    An mp4 with its moov at the end can't be read from a pipe, it is saved
+    to the workspace first and removed once it's remuxed, see `moovAtEnd`.
+    Subtitle streams can't go through MPEG-TS and are dropped.
+    :param `c`: Client used to stream the media.
+    :param `messages`: List of video messages in merge order.
+    :param `user_id`: Pass user_id as integer.
+    :param `message`: Pass Editable Message for Showing Progress.
+    :param `format_`: Pass File Extension.
+    :param `job_id`: Job whose workspace gets the output.
+    :param `metadata`: Saved metadata of the user, written in the same pass.
+    :param `extra_formats`: Other containers to write from the same pass, see `teeOutputs`.
+    :return: This will return Merged Video File Path
+    """
+    sources = [
+        (
+            (m.video or m.document).file_name,
+            (m.video or m.document).file_size or 0,
+            lambda m=m: c.stream_media(m),
+        )
+        for m in messages
+    ]
+    return await _stream_merge(
+        c, sources, user_id, message, format_, job_id, metadata, extra_formats
+    )
+
+
+async def MergeRemoteStream(
+    c: Client,
+    conf_path: str,
+    entries: list,
+    user_id: int,
+    message: Message,
+    format_: str,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
+    """
+    Same as `MergeVideoStream` for files on the user's rclone remote, read
+    with `rclone cat` so they never go through Telegram or the disk.
+    :param `conf_path`: rclone config of the user.
+    :param `entries`: List of `(remote_path, name, size)` in merge order.
+    :return: This will return Merged Video File Path
+    """
+    sources = [
+        (name, size, lambda path=path: rcloneCat(conf_path, path))
+        for path, name, size in entries
+    ]
+    return await _stream_merge(
+        c, sources, user_id, message, format_, job_id, metadata, extra_formats
+    )
+
+
+async def MergeArchiveStream(
+    c: Client,
+    archive: str,
+    entries: list,
+    user_id: int,
+    message: Message,
+    format_: str,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
+    """
+    Same as `MergeVideoStream` for the videos inside an archive. Members are
+    decompressed to a pipe, and the next one starts while the current one merges.
+    :param `archive`: Path of the downloaded archive.
+    :param `entries`: List of `(member_path, size)` in merge order.
+    :return: This will return Merged Video File Path
+    """
+    reader = ArchiveReader(archive, [path for path, _ in entries])
+    sources = [
+        (path, size, lambda n=n: reader.chunks(n))
+        for n, (path, size) in enumerate(entries)
+    ]
+    try:
+        return await _stream_merge(
+            c, sources, user_id, message, format_, job_id, metadata, extra_formats
+        )
+    finally:
+        reader.close()
+
+
+def moovAtEnd(head: bytes):
+    """
+    Reads the top level boxes at the start of an mp4/mov file.
+
+    Parameters:
+    - `head`: First bytes of the file, `MP4_HEAD_SIZE` is plenty.
+
+    returns: `True` if the media data comes before the moov index, so the
+    file can't be demuxed from a pipe. `False` for other containers.
+    """
+    if head[4:8] != b"ftyp":
+        return False
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos : pos + 4], "big")
+        kind = head[pos + 4 : pos + 8]
+        if kind == b"moov":
+            return False
+        if kind == b"mdat":
+            return True
+        if size == 1 and pos + 16 <= len(head):
+            size = int.from_bytes(head[pos + 8 : pos + 16], "big")
+        if size < 8:
+            # runs to the end of the file, or a broken header
+            break
+        pos += size
+    return False
+
+
+async def _stream_merge(
+    c: Client,
+    sources: list,
+    user_id: int,
+    message: Message,
+    format_: str,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
+    # the feeders and the merger only copy, they share one slot so nothing
+    # gets streamed into a merger that is still queued
+    waiting = reportQueue(Progress(user_id, c, message), "io", "🔀 Streaming merge")
+    async with governed("io", waiting) as acquired:
+        if not acquired:
+            return None
+        return await _feed_and_merge(
+            c, sources, user_id, message, format_, job_id, metadata, extra_formats
+        )
+
+
+async def _feed_and_merge(
+    c: Client,
+    sources: list,
+    user_id: int,
+    message: Message,
+    format_: str,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
+    # sources: (name, size, function returning an async iterator of chunks)
+    stream_dir = f"{jobDir(user_id, job_id)}/stream"
+    os.makedirs(stream_dir, exist_ok=True)
+    fifos = []
+    for n in range(len(sources)):
+        fifo = f"{stream_dir}/{n}.ts"
+        if os.path.lexists(fifo):
+            os.remove(fifo)
+        os.mkfifo(fifo)
+        fifos.append(fifo)
+    input_file = f"{stream_dir}/input.txt"
+    with open(input_file, "w") as _list:
+        # relative to the list file
+        _list.write("\n".join([f"file '{n}.ts'" for n in range(len(fifos))]))
+    output_vid = f"{jobDir(user_id, job_id)}/[@yashoswalyo].{format_.lower()}"
+    merge_command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        input_file,
+        *_input_maps(output_vid, extra_formats),
+        "-c",
+        "copy",
+        *metadataArgs(metadata),
+        *_output_args(output_vid, extra_formats),
+    ]
+    # progress comes from the feeders, the merger only runs for its exit code
+    merge_task = asyncio.ensure_future(runFFmpeg(merge_command, kind=None))
+    prog = AggregateProgress(
+        Progress(user_id, c, message),
+        sum([size for _, size, _ in sources]),
+        len(sources),
+        "🔀 Streaming and merging videos",
+    )
+    feeders = []
+
+    async def _feed():
+        for n, (name, size, chunks) in enumerate(sources):
+            source = chunks().__aiter__()
+            head = b""
+            async for chunk in source:
+                head += chunk
+                if len(head) >= MP4_HEAD_SIZE:
+                    break
+
+            async def _all(head=head, source=source):
+                if head:
+                    yield head
+                async for chunk in source:
+                    yield chunk
+
+            spool = None
+            if moovAtEnd(head):
+                # ffmpeg can't seek back to the index in a pipe, this input
+                # goes through the disk instead
+                spool = f"{stream_dir}/{n}.src"
+                LOGGER.info(f"{name} keeps its moov at the end, spooling it")
+            feedcmd = prioritized(
+                [
+                    "ffmpeg",
+                    "-hide_banner",
+                    "-y",
+                    "-i",
+                    spool or "pipe:0",
+                    "-map",
+                    "0:v?",
+                    "-map",
+                    "0:a?",
+                    "-c",
+                    "copy",
+                    "-f",
+                    "mpegts",
+                    fifos[n],
+                ],
+                "io",
+            )
+            LOGGER.info(f"Streaming {name}")
+            current = 0
+            if spool is None:
+                feeder = await spawn(
+                    feedcmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                feeders.append(feeder)
+                async for chunk in _all():
+                    feeder.stdin.write(chunk)
+                    await feeder.stdin.drain()
+                    current += len(chunk)
+                    await prog.update(current, size, n)
+                feeder.stdin.close()
+            else:
+                with open(spool, "wb") as out:
+                    async for chunk in _all():
+                        out.write(chunk)
+                        current += len(chunk)
+                        await prog.update(current, size, n)
+                feeder = await spawn(
+                    feedcmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                feeders.append(feeder)
+            await feeder.wait()
+            if spool is not None:
+                os.remove(spool)
+            prog.finished()
+            if feeder.returncode != 0:
+                raise Exception(f"Remux of {name} exited with {feeder.returncode}")
+
+    feed_task = asyncio.create_task(_feed())
+    try:
+        # if ffmpeg dies early the feeder would block forever on its FIFO
+        await asyncio.wait({feed_task, merge_task}, return_when=asyncio.FIRST_COMPLETED)
+        if not feed_task.done():
+            feed_task.cancel()
+            raise Exception(f"Merger exited early with {merge_task.result().returncode}")
+        feed_task.result()
+    except Exception as err:
+        LOGGER.warning(f"Streaming merge failed: {err}")
+        for feeder in feeders:
+            killGroup(feeder)
+        # cancelling runFFmpeg kills the merger's process group
+        merge_task.cancel()
+        await asyncio.gather(merge_task, return_exceptions=True)
+        return None
+    finally:
+        for fifo in fifos:
+            if os.path.lexists(fifo):
+                os.remove(fifo)
+    result = await merge_task
+    LOGGER.info(f"Streaming merge exited with {result.returncode}")
+    if result.ok and os.path.lexists(output_vid):
         return output_vid
     else:
         return None
 
 
-async def MergeSub(filePath: str, subPath: str, user_id):
+def _target_args(plan: dict):
+    target = plan["target"]
+    vf = []
+    if target.get("width") and target.get("height"):
+        vf.append(
+            f"scale={target['width']}:{target['height']}:force_original_aspect_ratio=decrease,"
+            f"pad={target['width']}:{target['height']}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+        )
+    if target.get("frame_rate") and target["frame_rate"] != "0/0":
+        vf.append(f"fps={target['frame_rate']}")
+    if target.get("pix_fmt"):
+        vf.append(f"format={target['pix_fmt']}")
+    af = []
+    if target.get("sample_rate"):
+        af.append(f"aresample={target['sample_rate']}")
+    if target.get("channel_layout"):
+        af.append(f"aformat=channel_layouts={target['channel_layout']}")
+    return vf, af
+
+
+async def NormalizeVideo(filePath: str, plan: dict, output: str):
+    """
+    Re-encodes one input so it can be concatenated with the others using stream copy.
+
+    Parameters:
+    - `filePath`: Path to the odd input.
+    - `plan`: Plan returned by `compat.planConcat`.
+    - `output`: Where to write the normalized file.
+
+    returns: Path of the normalized file, or `None` if ffmpeg failed.
+    """
+    vf, af = _target_args(plan)
+    normcmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-i",
+        filePath,
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a?",
+        "-map",
+        "0:s?",
+        "-c:v",
+        plan["vencoder"],
+        "-vf",
+        ",".join(vf) or "null",
+        "-c:s",
+        "copy",
+    ]
+    if plan.get("aencoder"):
+        normcmd += ["-c:a", plan["aencoder"], "-af", ",".join(af) or "anull"]
+    normcmd.append(output)
+    LOGGER.info(normcmd)
+    result = await runFFmpeg(normcmd)
+    if result.ok and os.path.lexists(output):
+        return output
+    else:
+        return None
+
+
+async def MergeVideoFilter(
+    file_list: list,
+    user_id: int,
+    message: Message,
+    format_: str,
+    plan: dict,
+    subtitle_file: str = None,
+    job_id: int = None,
+    metadata: dict = None,
+    extra_formats: list = None,
+):
+    """
+    Last resort merge for inputs too different to stream copy: decodes every
+    input and joins them with the concat filter. Only the first video and
+    audio track of each input are kept.
+    :param `file_list`: Paths of the inputs in merge order.
+    :param `user_id`: Pass user_id as integer.
+    :param `message`: Pass Editable Message for Showing FFmpeg Progress.
+    :param `format_`: Pass File Extension.
+    :param `plan`: Plan returned by `compat.planConcat`.
+    :param `subtitle_file`: Optional subtitle already timed for the merged video.
+    :param `job_id`: Job whose workspace gets the output.
+    :param `metadata`: Saved metadata of the user, written in the same pass.
+    :param `extra_formats`: Other containers to write from the same pass, see `teeOutputs`.
+    :return: This will return Merged Video File Path
+    """
+    output_vid = f"{jobDir(user_id, job_id)}/[@yashoswalyo].{format_.lower()}"
+    vf, af = _target_args(plan)
+    # the concat filter needs an audio pad from every input
+    has_audio = plan["all_audio"]
+    filtercmd = ["ffmpeg", "-hide_banner", "-y"]
+    graph = []
+    for path in file_list:
+        filtercmd += ["-i", path]
+    if subtitle_file is not None:
+        filtercmd += ["-i", subtitle_file]
+    for n in range(len(file_list)):
+        graph.append(f"[{n}:v:0]{','.join(vf) or 'null'}[v{n}]")
+        if has_audio:
+            graph.append(f"[{n}:a:0]{','.join(af) or 'anull'}[a{n}]")
+    pads = "".join(
+        [f"[v{n}]" + (f"[a{n}]" if has_audio else "") for n in range(len(file_list))]
+    )
+    graph.append(
+        f"{pads}concat=n={len(file_list)}:v=1:a={1 if has_audio else 0}[v]"
+        + ("[a]" if has_audio else "")
+    )
+    filtercmd += ["-filter_complex", ";".join(graph), "-map", "[v]"]
+    if has_audio:
+        filtercmd += ["-map", "[a]", "-c:a", plan["aencoder"]]
+    filtercmd += ["-c:v", plan["vencoder"]]
+    if subtitle_file is not None:
+        filtercmd += [
+            "-map",
+            f"{len(file_list)}:s",
+            "-metadata:s:s:0",
+            "title=Track 1 - tg@yashoswalyo",
+            "-c:s",
+            "copy",
+        ]
+    filtercmd += metadataArgs(metadata)
+    filtercmd += _output_args(output_vid, extra_formats)
+    LOGGER.info(filtercmd)
+    await message.edit("Re-encoding videos to merge them ...\n\nThis will take a while ...")
+    result = await runFFmpeg(
+        filtercmd,
+        duration=await _total_duration(file_list),
+        progress=_progress(user_id, message),
+        ud_type="🔀 Re-encoding and merging videos",
+    )
+    if result.ok and os.path.lexists(output_vid):
+        return output_vid
+    else:
+        return None
+
+
+async def MergeSub(filePath: str, subPath: str, user_id, job_id=None):
     """
     This is for Merging Video + Subtitle Together.
 
@@ -68,6 +628,7 @@ async def MergeSub(filePath: str, subPath: str, user_id):
     - `filePath`: Path to Video file.
     - `subPath`: Path to subtitile file.
     - `user_id`: To get parent directory.
+    - `job_id`: Job whose workspace gets the output.
 
     returns: Merged Video File Path
     """
@@ -87,12 +648,7 @@ async def MergeSub(filePath: str, subPath: str, user_id):
     muxcmd.append("0:s:?")
     muxcmd.append("-map")
     muxcmd.append("1:s")
-    videoData = ffmpeg.probe(filename=filePath)
-    videoStreamsData = videoData.get("streams")
-    subTrack = 0
-    for i in range(len(videoStreamsData)):
-        if videoStreamsData[i]["codec_type"] == "subtitle":
-            subTrack += 1
+    subTrack = len(await probeStreams(filePath, "subtitle"))
     muxcmd.append(f"-metadata:s:s:{subTrack}")
     subTrack += 1
     subTitle = f"Track {subTrack} - tg@yashoswalyo"
@@ -103,16 +659,26 @@ async def MergeSub(filePath: str, subPath: str, user_id):
     muxcmd.append("copy")
     muxcmd.append("-c:s")
     muxcmd.append("srt")
-    muxcmd.append(f"./downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv")
+    muxcmd.append(f"{jobDir(user_id, job_id)}/[@yashoswalyo]_softmuxed_video.mkv")
     LOGGER.info("Muxing subtitles")
-    subprocess.call(muxcmd)
+    result = await runFFmpeg(muxcmd)
+    if not result.ok:
+        return None
     orgFilePath = shutil.move(
-        f"downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv", filePath
+        f"{jobDir(user_id, job_id)}/[@yashoswalyo]_softmuxed_video.mkv", filePath
     )
     return orgFilePath
 
 
-def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
+async def MergeSubNew(
+    filePath: str,
+    subPath: str,
+    user_id,
+    file_list,
+    job_id=None,
+    metadata=None,
+    message: Message = None,
+):
     """
     This method is for Merging Video + Subtitle(s) Together.
 
@@ -121,6 +687,9 @@ def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
     - `subPath`: Path to subtitile file.
     - `user_id`: To get parent directory.
     - `file_list`: List of all input files
+    - `job_id`: Job whose workspace gets the output.
+    - `metadata`: Saved metadata of the user, written in the same pass.
+    - `message`: Editable Message for showing progress.
 
     returns: Merged Video File Path
     """
@@ -128,12 +697,7 @@ def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
     muxcmd = []
     muxcmd.append("ffmpeg")
     muxcmd.append("-hide_banner")
-    videoData = ffmpeg.probe(filename=filePath)
-    videoStreamsData = videoData.get("streams")
-    subTrack = 0
-    for i in range(len(videoStreamsData)):
-        if videoStreamsData[i]["codec_type"] == "subtitle":
-            subTrack += 1
+    subTrack = len(await probeStreams(filePath, "subtitle"))
     for i in file_list:
         muxcmd.append("-i")
         muxcmd.append(i)
@@ -155,21 +719,43 @@ def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
     muxcmd.append("copy")
     muxcmd.append("-c:s")
     muxcmd.append("srt")
-    muxcmd.append(f"./downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv")
+    muxcmd += metadataArgs(metadata)
+    muxcmd.append(f"{jobDir(user_id, job_id)}/[@yashoswalyo]_softmuxed_video.mkv")
     LOGGER.info("Sub muxing")
-    subprocess.call(muxcmd)
-    return f"downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv"
+    result = await runFFmpeg(
+        muxcmd,
+        duration=await probeDuration(filePath),
+        progress=_progress(user_id, message),
+        ud_type="📜 Muxing subtitles",
+    )
+    if not result.ok:
+        return None
+    return f"{jobDir(user_id, job_id)}/[@yashoswalyo]_softmuxed_video.mkv"
 
 
-def MergeAudio(videoPath: str, files_list: list, user_id):
+async def MergeAudio(
+    videoPath: str,
+    files_list: list,
+    user_id,
+    job_id=None,
+    metadata=None,
+    offsets=None,
+    message: Message = None,
+):
+    """
+    :param `offsets`: Seconds to shift each of `files_list` by, see `findOffset`.
+    :param `message`: Editable Message for showing progress.
+    """
     LOGGER.info("Generating Mux Command")
     muxcmd = []
     muxcmd.append("ffmpeg")
     muxcmd.append("-hide_banner")
-    videoData = ffmpeg.probe(filename=videoPath)
-    videoStreamsData = videoData.get("streams")
+    videoStreamsData = await probeStreams(videoPath)
     audioTracks = 0
-    for i in files_list:
+    for n, i in enumerate(files_list):
+        if offsets and offsets[n]:
+            muxcmd.append("-itsoffset")
+            muxcmd.append(str(offsets[n]))
         muxcmd.append("-i")
         muxcmd.append(i)
     muxcmd.append("-map")
@@ -199,45 +785,298 @@ def MergeAudio(videoPath: str, files_list: list, user_id):
     muxcmd.append("copy")
     muxcmd.append("-c:s")
     muxcmd.append("copy")
-    muxcmd.append(f"downloads/{str(user_id)}/[@yashoswalyo]_export.mkv")
+    muxcmd += metadataArgs(metadata)
+    muxcmd.append(f"{jobDir(user_id, job_id)}/[@yashoswalyo]_export.mkv")
 
     LOGGER.info(muxcmd)
-    process = subprocess.call(muxcmd)
-    LOGGER.info(process)
-    return f"downloads/{str(user_id)}/[@yashoswalyo]_export.mkv"
+    result = await runFFmpeg(
+        muxcmd,
+        duration=await probeDuration(videoPath),
+        progress=_progress(user_id, message),
+        ud_type="🎵 Muxing audio",
+    )
+    if not result.ok:
+        return None
+    return f"{jobDir(user_id, job_id)}/[@yashoswalyo]_export.mkv"
+
 
+async def MergeAudioSub(
+    videoPath: str,
+    audio_list: list,
+    sub_list: list,
+    user_id,
+    job_id=None,
+    metadata=None,
+    message: Message = None,
+):
+    """
+    This method is for Merging Video + Audio(s) + Subtitle(s) in a single pass.
+
+    Parameters:
+    - `videoPath`: Path to Video file.
+    - `audio_list`: Paths of audio files to add.
+    - `sub_list`: Paths of subtitle files to add.
+    - `user_id`: To get parent directory.
+    - `job_id`: Job whose workspace gets the output.
+    - `metadata`: Saved metadata of the user, written in the same pass.
+    - `message`: Editable Message for showing progress.
 
-async def cult_small_video(video_file, output_directory, start_time, end_time, format_):
+    returns: Merged Video File Path
+    """
+    LOGGER.info("Generating Mux Command")
+    muxcmd = []
+    muxcmd.append("ffmpeg")
+    muxcmd.append("-hide_banner")
+    videoStreamsData = await probeStreams(videoPath)
+    files_list = [videoPath] + audio_list + sub_list
+    for i in files_list:
+        muxcmd.append("-i")
+        muxcmd.append(i)
+    muxcmd.append("-map")
+    muxcmd.append("0:v:0")
+    muxcmd.append("-map")
+    muxcmd.append("0:a:?")
+    audioTracks = 0
+    subTrack = 0
+    for i in range(len(videoStreamsData)):
+        if videoStreamsData[i]["codec_type"] == "audio":
+            muxcmd.append(f"-disposition:a:{audioTracks}")
+            muxcmd.append("0")
+            audioTracks += 1
+        elif videoStreamsData[i]["codec_type"] == "subtitle":
+            subTrack += 1
+    fAudio = audioTracks
+    for j in range(1, len(audio_list) + 1):
+        muxcmd.append("-map")
+        muxcmd.append(f"{j}:a")
+        muxcmd.append(f"-metadata:s:a:{audioTracks}")
+        muxcmd.append(f"title=Track {audioTracks+1} - tg@yashoswalyo")
+        audioTracks += 1
+    if audio_list:
+        muxcmd.append(f"-disposition:a:{fAudio}")
+        muxcmd.append("default")
+    muxcmd.append("-map")
+    muxcmd.append("0:s:?")
+    for j in range(len(audio_list) + 1, len(files_list)):
+        muxcmd.append("-map")
+        muxcmd.append(f"{j}:s")
+        muxcmd.append(f"-metadata:s:s:{subTrack}")
+        muxcmd.append(f"title=Track {subTrack+1} - tg@yashoswalyo")
+        subTrack += 1
+    muxcmd.append("-c:v")
+    muxcmd.append("copy")
+    muxcmd.append("-c:a")
+    muxcmd.append("copy")
+    muxcmd.append("-c:s")
+    muxcmd.append("copy")
+    muxcmd += metadataArgs(metadata)
+    muxcmd.append(f"{jobDir(user_id, job_id)}/[@yashoswalyo]_export.mkv")
+
+    LOGGER.info(muxcmd)
+    result = await runFFmpeg(
+        muxcmd,
+        duration=await probeDuration(videoPath),
+        progress=_progress(user_id, message),
+        ud_type="🎵 Muxing audio",
+    )
+    if not result.ok:
+        return None
+    return f"{jobDir(user_id, job_id)}/[@yashoswalyo]_export.mkv"
+
+
+async def cult_small_video(
+    video_file, output_directory, start_time, end_time, format_, video_args=None
+):
+    """
+    Cuts `start_time` to `end_time` out of a video with re-encoding, so the
+    cut is frame accurate wherever it falls.
+
+    Parameters:
+    - `output_directory`: Prefix of the output path.
+    - `video_args`: Encoder arguments. When given only the first video
+      stream is kept and encoded with them, to match a stream-copied neighbour.
+
+    returns: Path of the clip, or `None` if ffmpeg failed.
+    """
     # https://stackoverflow.com/a/13891070/4723940
     out_put_file_name = (
         output_directory + str(round(time.time())) + "." + format_.lower()
     )
+    # only worth it when already scanned, a cold scan reads the whole file
+    index = cachedKeyframeIndex(video_file)
+    keyframe = index.atOrBefore(start_time) if index is not None else None
+    if keyframe is None:
+        # ffmpeg finds the keyframe itself and decodes from there, still exact
+        seek = ["-ss", str(start_time), "-i", video_file]
+    else:
+        # jump straight to the known keyframe, drop the decoded frames before the cut
+        seek = ["-ss", str(keyframe), "-i", video_file, "-ss", str(start_time - keyframe)]
     file_generator_command = [
         "ffmpeg",
+        "-hide_banner",
+        "-y",
+        *seek,
+        "-t",
+        str(end_time - start_time),
+    ]
+    if video_args is None:
+        file_generator_command += ["-async", "1", "-strict", "-2"]
+    else:
+        file_generator_command += ["-map", "0:v:0", *video_args, "-an", "-sn"]
+    file_generator_command.append(out_put_file_name)
+    result = await runFFmpeg(file_generator_command)
+    if result.ok and os.path.lexists(out_put_file_name):
+        return out_put_file_name
+    else:
+        return None
+
+
+async def _copy_range(video_file, output, start, end, streams, pre_seek=0, bsf=None):
+    # stream copy, starts on the packet at `start` of the mapped streams
+    copycmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
         "-ss",
-        str(start_time),
-        "-to",
-        str(end_time),
+        f"{start - pre_seek:.6f}",
         "-i",
         video_file,
-        "-async",
-        "1",
-        "-strict",
-        "-2",
-        out_put_file_name,
     ]
-    process = await asyncio.create_subprocess_exec(
-        *file_generator_command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
-    LOGGER.info(e_response)
-    LOGGER.info(t_response)
-    if os.path.lexists(out_put_file_name):
-        return out_put_file_name
+    if pre_seek:
+        # input seeking lands on a video keyframe, drop what comes before `start`
+        copycmd += ["-ss", f"{pre_seek:.6f}"]
+    copycmd += [
+        "-t",
+        f"{end - start:.6f}",
+        "-map",
+        streams,
+        "-c",
+        "copy",
+    ]
+    if bsf is not None:
+        copycmd += ["-bsf:v", bsf]
+    copycmd += [
+        "-avoid_negative_ts",
+        "make_zero",
+        output,
+    ]
+    LOGGER.info(copycmd)
+    result = await runFFmpeg(copycmd)
+    if not result.ok:
+        return None
+    return output
+
+
+async def SmartCut(
+    filePath: str,
+    ranges: list,
+    user_id: int,
+    message: Message,
+    job_id: int = None,
+    metadata: dict = None,
+):
+    """
+    Keeps only the given ranges of a video. Whole GOPs inside a range are
+    stream copied, only the partial GOPs at each cut are re-encoded with
+    `cult_small_video`, and the pieces are joined with the concat demuxer.
+    Every video piece is written as MPEG-TS with its parameter sets in
+    band, so the copied GOPs keep decoding with the source's SPS/PPS after
+    an encoded piece with different ones. Sources that can't go through
+    Annex-B are re-encoded range by range instead.
+    Audio is stream copied per range. Subtitles are dropped.
+
+    Parameters:
+    - `filePath`: Path to Video file.
+    - `ranges`: Sorted `(start, end)` pairs in seconds.
+    - `message`: Editable Message for showing progress.
+    - `job_id`: Job whose workspace gets the output.
+    - `metadata`: Saved metadata of the user, written in the final mux.
+
+    returns: Path of the trimmed video, or `None` on failure.
+    """
+    work_dir = f"{jobDir(user_id, job_id)}/trim"
+    os.makedirs(work_dir, exist_ok=True)
+    sig = await streamSignature(filePath)
+    annexb = ANNEXB_FILTERS.get(sig.get("vcodec"))
+    encoder = pickEncoder(sig.get("vcodec"), VIDEO_ENCODERS) if annexb else None
+    if encoder is None:
+        # can't mix copied and encoded GOPs, re-encode every piece the same way instead
+        LOGGER.info(f"Can't smart cut {sig.get('vcodec')}, re-encoding whole ranges")
+        encoder = pickEncoder("h264", VIDEO_ENCODERS)
+        index = None
+    else:
+        index = await keyframeIndex(filePath)
+    vf, _ = _target_args({"target": sig})
+    # dump_extra repeats the encoder's headers on every keyframe
+    video_args = ["-c:v", encoder, "-vf", ",".join(vf) or "null", "-bsf:v", "dump_extra"]
+    video_pieces = []
+    audio_pieces = []
+    for n, (start, end) in enumerate(ranges):
+        await message.edit(f"✂️ Cutting range {n + 1}/{len(ranges)} ...")
+        inner = index.between(start, end) if index is not None else []
+        pieces = []
+        if len(inner) >= 2:
+            first, last = inner[0], inner[-1]
+            if first > start:
+                pieces.append(("encode", start, first))
+            pieces.append(("copy", first, last))
+            if end > last:
+                pieces.append(("encode", last, end))
+        else:
+            # not even one whole GOP in the range
+            pieces.append(("encode", start, end))
+        for kind, a, b in pieces:
+            prefix = f"{work_dir}/v{len(video_pieces):04d}_"
+            if kind == "copy":
+                # a hair past the keyframe so the seek can't fall on the one before
+                piece = await _copy_range(
+                    filePath, f"{prefix}.ts", a + 0.001, b, "0:v:0", bsf=annexb
+                )
+            else:
+                piece = await cult_small_video(filePath, prefix, a, b, "ts", video_args)
+            if piece is None:
+                return None
+            video_pieces.append(os.path.abspath(piece))
+        if sig.get("audio_streams"):
+            piece = await _copy_range(
+                filePath,
+                f"{work_dir}/a{n:04d}.mka",
+                start,
+                end,
+                "0:a",
+                pre_seek=min(start, 10),
+            )
+            if piece is None:
+                return None
+            audio_pieces.append(os.path.abspath(piece))
+    lists = []
+    for name, pieces in (("video", video_pieces), ("audio", audio_pieces)):
+        if not pieces:
+            continue
+        with open(f"{work_dir}/{name}.txt", "w") as _list:
+            _list.write("\n".join([f"file '{p}'" for p in pieces]))
+        lists += ["-f", "concat", "-safe", "0", "-i", f"{work_dir}/{name}.txt"]
+    output = f"{jobDir(user_id, job_id)}/[@yashoswalyo]_trimmed.mkv"
+    joincmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        *lists,
+        "-map",
+        "0:v",
+        "-map",
+        "1:a?" if audio_pieces else "0:a?",
+        "-c",
+        "copy",
+        *metadataArgs(metadata),
+        output,
+    ]
+    await message.edit(f"🔗 Joining {len(video_pieces)} pieces ...")
+    LOGGER.info(joincmd)
+    result = await runFFmpeg(joincmd)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if result.ok and os.path.lexists(output):
+        return output
     else:
         return None
 
@@ -256,6 +1095,11 @@ async def take_screen_shot(video_file, output_directory, ttl):
     """
     # https://stackoverflow.com/a/13891070/4723940
     out_put_file_name = os.path.join(output_directory, str(time.time()) + ".jpg")
+    # a fresh output is never indexed, one seek beats reading the whole file
+    index = cachedKeyframeIndex(video_file)
+    if index is not None and index.atOrBefore(ttl) is not None:
+        # a keyframe needs no decoding of the frames before it
+        ttl = index.atOrBefore(ttl)
     if video_file.upper().endswith(
         (
             "MKV",
@@ -284,16 +1128,7 @@ async def take_screen_shot(video_file, output_directory, ttl):
             out_put_file_name,
         ]
         # width = "90"
-        process = await asyncio.create_subprocess_exec(
-            *file_genertor_command,
-            # stdout must a pipe to be accessible as process.stdout
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        # Wait for the subprocess to finish
-        stdout, stderr = await process.communicate()
-        e_response = stderr.decode().strip()
-        t_response = stdout.decode().strip()
+        await runFFmpeg(file_genertor_command, timeout=120)
     #
     if os.path.exists(out_put_file_name):
         return out_put_file_name
@@ -301,18 +1136,18 @@ async def take_screen_shot(video_file, output_directory, ttl):
         return None
 
 
-async def extractAudios(path_to_file, user_id):
+async def extractAudios(path_to_file, user_id, job_id=None):
     """
     docs
     """
-    dir_name = os.path.dirname(os.path.dirname(path_to_file))
+    dir_name = jobDir(user_id, job_id)
     if not os.path.exists(path_to_file):
         return None
     if not os.path.exists(dir_name + "/extract"):
         os.makedirs(dir_name + "/extract")
-    videoStreamsData = ffmpeg.probe(path_to_file)
-    # with open("data.json",'w') as f:
-    #     f.write(json.dumps(videoStreamsData))
+    videoStreamsData = await probeMedia(path_to_file)
+    if videoStreamsData is None:
+        return None
     extract_dir = dir_name + "/extract"
     audios = []
     for stream in videoStreamsData.get("streams"):
@@ -348,7 +1183,7 @@ async def extractAudios(path_to_file, user_id):
             extractcmd.append("copy")
             extractcmd.append(f"{extract_dir}/{output_file}")
             LOGGER.info(extractcmd)
-            subprocess.call(extractcmd)
+            await runFFmpeg(extractcmd)
         except Exception as e:
             LOGGER.error(f"Something went wrong: {e}")
     if get_path_size(extract_dir) > 0:
@@ -358,18 +1193,18 @@ async def extractAudios(path_to_file, user_id):
         return None
 
 
-async def extractSubtitles(path_to_file, user_id):
+async def extractSubtitles(path_to_file, user_id, job_id=None):
     """
     docs
     """
-    dir_name = os.path.dirname(os.path.dirname(path_to_file))
+    dir_name = jobDir(user_id, job_id)
     if not os.path.exists(path_to_file):
         return None
     if not os.path.exists(dir_name + "/extract"):
         os.makedirs(dir_name + "/extract")
-    videoStreamsData = ffmpeg.probe(path_to_file)
-    # with open("data.json",'w') as f:
-    #     f.write(json.dumps(videoStreamsData))
+    videoStreamsData = await probeMedia(path_to_file)
+    if videoStreamsData is None:
+        return None
     extract_dir = dir_name + "/extract"
     subtitles = []
     for stream in videoStreamsData.get("streams"):
@@ -417,7 +1252,7 @@ async def extractSubtitles(path_to_file, user_id):
             extractcmd.append("copy")
             extractcmd.append(f"{extract_dir}/{output_file}")
             LOGGER.info(extractcmd)
-            subprocess.call(extractcmd)
+            await runFFmpeg(extractcmd)
         except Exception as e:
             LOGGER.error(f"Something went wrong: {e}")
     if get_path_size(extract_dir) > 0:
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import signal
+import time
+from collections import deque
+
+from __init__ import LOGGER
+
+from helpers.governor import governed, prioritized, reportQueue, workKind
+
+AUTO = "auto"
+STDERR_LINES = 40  # last stderr lines kept for the log when a command fails
+WATCH_INTERVAL = 1  # seconds between cancel and timeout checks
+
+
+class FFmpegResult(object):
+    def __init__(self, returncode: int, stderr: deque, stdout: bytes = b""):
+        self.returncode: int = returncode
+        self.stderr: deque = stderr
+        self.stdout: bytes = stdout
+        self.cancelled: bool = False
+        self.timed_out: bool = False
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not (self.cancelled or self.timed_out)
+
+    @property
+    def tail(self):
+        return "\n".join(self.stderr)
+
+
+def killGroup(process):
+    """
+    Kills a process started by `spawn` together with anything it started.
+    """
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def spawn(cmd: list, stdin=None, stdout=None, stderr=asyncio.subprocess.PIPE):
+    """
+    Starts a command in its own process group, so `killGroup` can stop it
+    with its children. A piped stderr has to be drained by the caller.
+    """
+    return await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=stdin,
+        stdout=stdout if stdout is not None else asyncio.subprocess.DEVNULL,
+        stderr=stderr,
+        start_new_session=True,
+    )
+
+
+async def _read_stderr(stream, lines: deque):
+    async for line in stream:
+        lines.append(line.decode(errors="replace").rstrip())
+
+
+async def _read_progress(stream, duration: float, progress, ud_type: str, start: float):
+    # -progress writes blocks of key=value lines, each ending with progress=...
+    block = {}
+    async for line in stream:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        block[key] = value
+        if key != "progress":
+            continue
+        # out_time_ms is in microseconds as well, ffmpeg named it wrong
+        done = block.get("out_time_us") or block.get("out_time_ms") or ""
+        if done.lstrip("-").isdigit() and progress is not None and duration:
+            speed = block.get("speed", "").rstrip("x")
+            await progress.progress_for_ffmpeg(
+                min(int(done) / 1000000, duration),
+                duration,
+                float(speed) if speed.replace(".", "", 1).isdigit() else 0,
+                ud_type,
+                start,
+            )
+        block = {}
+
+
+async def runFFmpeg(
+    cmd: list,
+    duration: float = None,
+    progress=None,
+    ud_type: str = "⚙️ Processing",
+    timeout: float = None,
+    capture_stdout: bool = False,
+    kind: str = AUTO,
+):
+    """
+    Runs ffmpeg (or ffprobe) without blocking the event loop, once the
+    governor has a free slot for it.
+
+    Parameters:
+    - `cmd`: Full command, starting with the program.
+    - `duration`: Length of the output in seconds, for percentage and ETA.
+    - `progress`: `Progress` of the job's status message. Its cancel button
+      kills the command, and it shows the queue position while waiting.
+    - `ud_type`: Title shown above the progress bar.
+    - `timeout`: Seconds after which the command is killed, not counting
+      the wait for a slot.
+    - `capture_stdout`: Return what the command writes to stdout, e.g. raw
+      samples or probe output. No progress is parsed then.
+    - `kind`: Governor slot to take, `"cpu"` or `"io"`, `None` for none.
+      Guessed from the command by default.
+
+    returns: `FFmpegResult` with the exit code and the last stderr lines.
+    """
+    if kind == AUTO:
+        kind = workKind(cmd)
+    if kind is None:
+        return await _run(cmd, duration, progress, ud_type, timeout, capture_stdout, kind)
+    async with governed(kind, reportQueue(progress, kind, ud_type)) as acquired:
+        if not acquired:
+            result = FFmpegResult(None, deque())
+            result.cancelled = True
+            LOGGER.info(f"Cancelled {cmd[0]} while waiting for a {kind} slot")
+            return result
+        return await _run(cmd, duration, progress, ud_type, timeout, capture_stdout, kind)
+
+
+async def _run(cmd, duration, progress, ud_type, timeout, capture_stdout, kind):
+    cmd = list(cmd)
+    parse_progress = not capture_stdout and os.path.basename(cmd[0]) == "ffmpeg"
+    if parse_progress:
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+    start = time.time()
+    process = await spawn(prioritized(cmd, kind), stdout=asyncio.subprocess.PIPE)
+    stderr = deque(maxlen=STDERR_LINES)
+    readers = [asyncio.ensure_future(_read_stderr(process.stderr, stderr))]
+    if parse_progress:
+        readers.append(
+            asyncio.ensure_future(
+                _read_progress(process.stdout, duration, progress, ud_type, start)
+            )
+        )
+    else:
+        readers.append(asyncio.ensure_future(process.stdout.read()))
+    result = FFmpegResult(None, stderr)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), WATCH_INTERVAL)
+                break
+            except asyncio.TimeoutError:
+                pass
+            if progress is not None and progress.is_cancelled:
+                result.cancelled = True
+                killGroup(process)
+            elif timeout is not None and time.time() - start > timeout:
+                result.timed_out = True
+                killGroup(process)
+        await asyncio.gather(*readers, return_exceptions=True)
+    except asyncio.CancelledError:
+        killGroup(process)
+        for reader in readers:
+            reader.cancel()
+        raise
+    result.returncode = process.returncode
+    if not parse_progress and not readers[1].exception():
+        result.stdout = readers[1].result()
+    if result.cancelled:
+        LOGGER.info(f"Cancelled {cmd[0]} after {round(time.time() - start)}s")
+    elif result.timed_out:
+        LOGGER.warning(f"{cmd[0]} timed out after {timeout}s\n{result.tail}")
+    elif result.returncode != 0:
+        LOGGER.warning(f"{cmd[0]} exited with {result.returncode}\n{result.tail}")
+    return result
+
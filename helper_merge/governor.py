@@ -0,0 +1,219 @@
+import asyncio
+import os
+import shutil
+from collections import deque
+from contextlib import asynccontextmanager
+
+from __init__ import LOGGER
+
+ENCODE_MEMORY = 768 * 1024 * 1024  # what one encode may take, x264 lookahead and frames
+COPY_MEMORY = 192 * 1024 * 1024  # what one stream copy or upload may take
+WAIT_REPORT = 5  # seconds between queue position checks while waiting
+# nice and ionice best-effort levels, the bot itself stays responsive either way
+NICENESS = {"cpu": 10, "io": 5}
+IO_PRIORITY = {"cpu": 4, "io": 7}
+
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpuCount():
+    """
+    CPUs this process may really use: the cgroup quota of the container if
+    there is one, else the CPUs it may run on.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = None
+    # cgroup v2, "max 100000" when unlimited
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max is not None:
+        limit, _, period = cpu_max.partition(" ")
+        if limit.isdigit() and period.isdigit():
+            quota = int(limit) / int(period)
+    else:
+        # cgroup v1, -1 when unlimited
+        limit = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and limit.isdigit() and period.isdigit():
+            quota = int(limit) / int(period)
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return cpus
+
+
+def memoryLimit():
+    """
+    returns: Bytes of memory this process may use, the cgroup limit if it is
+    lower than the machine's memory.
+    """
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError):
+        total = None
+    limit = _read("/sys/fs/cgroup/memory.max") or _read(
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    )
+    if limit is not None and limit.isdigit():
+        total = min(total or int(limit), int(limit))
+    return total
+
+
+class _Pool(object):
+    """
+    Slots of one kind of work, handed out first come first served so a
+    job can be told where it is in the queue.
+    """
+
+    def __init__(self, kind: str, slots: int):
+        self.kind: str = kind
+        self.slots: int = slots
+        self.busy: int = 0
+        self.waiting: deque = deque()
+
+    async def acquire(self, on_wait=None):
+        if self.busy < self.slots and not self.waiting:
+            self.busy += 1
+            return True
+        ticket = asyncio.get_event_loop().create_future()
+        self.waiting.append(ticket)
+        try:
+            while not ticket.done():
+                if on_wait is not None and ticket in self.waiting:
+                    if await on_wait(self.waiting.index(ticket) + 1) is False:
+                        if ticket.done():
+                            self.release()
+                        else:
+                            self.waiting.remove(ticket)
+                        return False
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket), WAIT_REPORT)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            if ticket.done():
+                # the slot was already handed over, pass it on
+                self.release()
+            else:
+                self.waiting.remove(ticket)
+            raise
+        return True
+
+    def release(self):
+        while self.waiting:
+            ticket = self.waiting.popleft()
+            if not ticket.done():
+                # the slot goes straight to the next in line
+                ticket.set_result(True)
+                return
+        self.busy -= 1
+
+
+def _sizePools():
+    cpus = cpuCount()
+    memory = memoryLimit()
+    cpu_slots = cpus
+    io_slots = max(2, cpus * 2)
+    if memory:
+        cpu_slots = min(cpu_slots, memory // ENCODE_MEMORY)
+        io_slots = min(io_slots, memory // COPY_MEMORY)
+    # a slow or shared disk is the one thing that can't be read from the cgroup
+    cpu_slots = int(os.environ.get("FFMPEG_CPU_SLOTS", 0)) or max(1, cpu_slots)
+    io_slots = int(os.environ.get("FFMPEG_IO_SLOTS", 0)) or max(1, io_slots)
+    LOGGER.info(
+        f"Governor: {cpus} cpus, {memory} bytes of memory -> "
+        f"{cpu_slots} encode and {io_slots} copy slots"
+    )
+    return {"cpu": _Pool("cpu", cpu_slots), "io": _Pool("io", io_slots)}
+
+
+_pools = _sizePools()
+
+
+def slotCount(kind: str):
+    return _pools[kind].slots
+
+
+def queueLength(kind: str):
+    return len(_pools[kind].waiting)
+
+
+@asynccontextmanager
+async def governed(kind: str, on_wait=None):
+    """
+    Holds a slot of `kind` while the block runs. Every heavy ffmpeg or
+    rclone process runs inside one.
+
+    Parameters:
+    - `kind`: `"cpu"` for encodes, `"io"` for stream copies and uploads.
+    - `on_wait`: Coroutine function called with the queue position while
+      waiting. Returning `False` stops waiting.
+
+    yields: `True` once there is a slot, `False` if `on_wait` gave up.
+    """
+    pool = _pools[kind]
+    acquired = await pool.acquire(on_wait)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            pool.release()
+
+
+def reportQueue(progress, kind: str, ud_type: str):
+    """
+    returns: `on_wait` for `governed` that shows the queue position on the
+    job's status message and gives up once the job is cancelled.
+    """
+
+    async def _waiting(position: int):
+        if progress is None:
+            return True
+        if progress.is_cancelled:
+            return False
+        await progress.waiting_for_slot(position, kind, ud_type)
+        return True
+
+    return _waiting
+
+
+def workKind(cmd: list):
+    """
+    returns: `"io"` for an ffmpeg command that only copies streams, `"cpu"`
+    if it decodes or encodes anything, `None` for anything else.
+    """
+    if os.path.basename(cmd[0]) != "ffmpeg":
+        return None
+    codecs = []
+    for n, arg in enumerate(cmd[:-1]):
+        if arg in ("-vf", "-af", "-filter_complex", "-lavfi", "-vframes"):
+            return "cpu"
+        if arg.split(":")[0] in ("-c", "-codec", "-vcodec", "-acodec", "-scodec"):
+            codecs.append(cmd[n + 1])
+    if not codecs:
+        # ffmpeg encodes to the container's defaults without a codec
+        return "cpu"
+    if all(codec in ("copy", "mov_text", "srt", "ass") for codec in codecs):
+        return "io"
+    return "cpu"
+
+
+def prioritized(cmd: list, kind: str):
+    """
+    returns: `cmd` run under nice and ionice for `kind`.
+    """
+    if kind is None:
+        return list(cmd)
+    wrapped = list(cmd)
+    if shutil.which("ionice"):
+        wrapped = ["ionice", "-c", "2", "-n", str(IO_PRIORITY[kind])] + wrapped
+    if shutil.which("nice"):
+        wrapped = ["nice", "-n", str(NICENESS[kind])] + wrapped
+    return wrapped
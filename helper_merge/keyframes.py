@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from __init__ import LOGGER
+
+INDEX_DIR = "downloads/.keyframes"
+MEMORY_SLOTS = 64  # indexes kept in memory, the rest are read back from disk
+DISK_SLOTS = 512  # indexes kept under INDEX_DIR, least recently used go first
+_indexes = OrderedDict()  # key -> KeyframeIndex
+_scans = {}  # key -> running scan, so a file is only scanned once at a time
+_file_ids = {}  # path -> file_unique_id of the telegram media it came from
+
+
+class KeyframeIndex(object):
+    """
+    Keyframes of the first video stream, as two packed arrays:
+    presentation times in seconds and byte offsets in the file.
+    """
+
+    def __init__(self, times: array = None, offsets: array = None):
+        self.times: array = times if times is not None else array("d")
+        self.offsets: array = offsets if offsets is not None else array("q")
+
+    def __len__(self):
+        return len(self.times)
+
+    def atOrBefore(self, t: float):
+        """
+        returns: Time of the last keyframe at or before `t`, `None` if there is none.
+        """
+        n = bisect_right(self.times, t)
+        return self.times[n - 1] if n else None
+
+    def between(self, start: float, end: float):
+        """
+        returns: Times of the keyframes from `start` to `end`, both included.
+        """
+        return list(self.times[bisect_left(self.times, start) : bisect_right(self.times, end)])
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            array("q", [len(self.times)]).tofile(f)
+            self.times.tofile(f)
+            self.offsets.tofile(f)
+
+    @classmethod
+    def load(cls, path: str):
+        index = cls()
+        with open(path, "rb") as f:
+            count = array("q")
+            count.fromfile(f, 1)
+            index.times.fromfile(f, count[0])
+            index.offsets.fromfile(f, count[0])
+        return index
+
+
+def rememberFile(path: str, file_unique_id: str):
+    """
+    Ties a downloaded file to its telegram media, so every job that
+    downloads the same media shares one index.
+    """
+    _file_ids[os.path.abspath(path)] = file_unique_id
+
+
+def fileKey(path: str):
+    """
+    Identity of a file for caches shared between jobs: the telegram media
+    it came from, else its path, size and modification time. The size is
+    part of it either way, so a file rewritten in place isn't mistaken
+    for the old one.
+    """
+    st = os.stat(path)
+    file_id = _file_ids.get(os.path.abspath(path))
+    if file_id is not None:
+        return f"{file_id}-{st.st_size}"
+    ident = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha1(ident.encode()).hexdigest()
+
+
+async def _scan(path: str):
+    # packets only, nothing is decoded
+    probecmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,pos,flags",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *probecmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    index = KeyframeIndex()
+    async for line in process.stdout:
+        pts, pos, flags = (line.decode().strip().split(",") + ["", ""])[:3]
+        if "K" not in flags or pts in ("", "N/A"):
+            continue
+        index.times.append(float(pts))
+        index.offsets.append(int(pos) if pos.isdigit() else -1)
+    stderr = await process.stderr.read()
+    await process.wait()
+    if process.returncode != 0:
+        LOGGER.warning(stderr.decode().strip()[-2000:])
+        return None
+    # packets come in decode order, keyframes normally already sorted
+    if any(index.times[n] < index.times[n - 1] for n in range(1, len(index))):
+        pairs = sorted(zip(index.times, index.offsets))
+        index = KeyframeIndex(array("d", [t for t, _ in pairs]), array("q", [o for _, o in pairs]))
+    return index
+
+
+def _pruneDisk():
+    try:
+        stored = [e for e in os.scandir(INDEX_DIR) if e.name.endswith(".idx")]
+    except OSError:
+        return
+    if len(stored) <= DISK_SLOTS:
+        return
+    # loading an index touches it, so mtime is the last use
+    stored.sort(key=lambda e: e.stat().st_mtime)
+    for entry in stored[: len(stored) - DISK_SLOTS]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _remember(key: str, index: KeyframeIndex):
+    _indexes[key] = index
+    _indexes.move_to_end(key)
+    while len(_indexes) > MEMORY_SLOTS:
+        _indexes.popitem(last=False)
+
+
+def cachedKeyframeIndex(path: str):
+    """
+    Keyframe index of a video only if some job already scanned it, for
+    callers where a full scan costs more than it saves, like one seek.
+
+    returns: `KeyframeIndex`, or `None` if it isn't cached.
+    """
+    try:
+        key = fileKey(path)
+    except OSError:
+        return None
+    if key in _indexes:
+        _indexes.move_to_end(key)
+        return _indexes[key]
+    stored = f"{INDEX_DIR}/{key}.idx"
+    if not os.path.exists(stored):
+        return None
+    try:
+        index = KeyframeIndex.load(stored)
+        os.utime(stored)
+    except Exception as e:
+        LOGGER.warning(f"Dropping broken keyframe index {stored}: {e}")
+        return None
+    _remember(key, index)
+    return index
+
+
+async def keyframeIndex(path: str):
+    """
+    Keyframe index of a video, scanned on first use and then kept in
+    memory and under `INDEX_DIR` for every later job on the same file.
+
+    returns: `KeyframeIndex`, or `None` if the file couldn't be scanned.
+    """
+    try:
+        key = fileKey(path)
+    except OSError:
+        return None
+    if key in _indexes:
+        _indexes.move_to_end(key)
+        return _indexes[key]
+    stored = f"{INDEX_DIR}/{key}.idx"
+    if key not in _scans:
+        async def _build():
+            if os.path.exists(stored):
+                try:
+                    index = KeyframeIndex.load(stored)
+                    os.utime(stored)
+                    return index
+                except Exception as e:
+                    LOGGER.warning(f"Dropping broken keyframe index {stored}: {e}")
+            index = await _scan(path)
+            if index is not None and len(index):
+                os.makedirs(INDEX_DIR, exist_ok=True)
+                index.save(stored)
+                _pruneDisk()
+                LOGGER.info(f"Indexed {len(index)} keyframes of {path}")
+            return index
+
+        _scans[key] = asyncio.ensure_future(_build())
+    try:
+        index = await _scans[key]
+    finally:
+        _scans.pop(key, None)
+    if index is None or not len(index):
+        return None
+    _remember(key, index)
+    return index
@@ -0,0 +1,158 @@
+import json
+from collections import OrderedDict
+
+from __init__ import LOGGER
+
+from helpers.ffmpeg_runner import runFFmpeg
+from helpers.keyframes import fileKey
+from helpers.probe import probeMedia
+
+CACHE_SLOTS = 512  # answers kept, each is three numbers
+HEADER_PROBE_SIZE = 2 * 1024 * 1024  # bytes the header probe may read
+_infos = OrderedDict()  # fileKey -> MediaInfo
+
+
+class MediaInfo(object):
+    """
+    Duration and dimensions of a media file, and which tier answered:
+    `telegram` attributes, a `header` probe or a `full` ffprobe.
+    """
+
+    def __init__(self, duration: float = 0, width: int = 0, height: int = 0, source: str = None):
+        self.duration: float = duration or 0
+        self.width: int = width or 0
+        self.height: int = height or 0
+        self.source: str = source
+
+    @property
+    def complete(self):
+        return self.duration > 0
+
+    def __repr__(self):
+        return f"MediaInfo({self.duration}s, {self.width}x{self.height}, {self.source})"
+
+
+def fromTelegram(media):
+    """
+    returns: `MediaInfo` from the attributes Telegram sent with a `Video`,
+    `Animation`, `Audio` or `VideoNote`, `None` for a `Document` or when
+    the uploader left them empty.
+    """
+    duration = getattr(media, "duration", None) or 0
+    if duration <= 0:
+        return None
+    return MediaInfo(
+        duration,
+        getattr(media, "width", 0),
+        getattr(media, "height", 0),
+        "telegram",
+    )
+
+
+def _remember(path: str, info: MediaInfo):
+    try:
+        key = fileKey(path)
+    except OSError:
+        return
+    _infos[key] = info
+    _infos.move_to_end(key)
+    while len(_infos) > CACHE_SLOTS:
+        _infos.popitem(last=False)
+
+
+def rememberMedia(path: str, media):
+    """
+    Keeps the Telegram attributes of a downloaded file, so asking about the
+    file later costs nothing.
+    """
+    info = fromTelegram(media)
+    if info is not None:
+        _remember(path, info)
+
+
+def _fromStreams(data: dict, source: str):
+    streams = data.get("streams", [])
+    video = [s for s in streams if s.get("codec_type") == "video"]
+    durations = [data.get("format", {}).get("duration")]
+    # matroska keeps stream durations in tags, fragmented mp4 sometimes only there
+    durations += [s.get("duration") or s.get("tags", {}).get("DURATION") for s in streams]
+    duration = 0
+    for d in durations:
+        try:
+            if d and ":" in str(d):
+                h, m, s = str(d).split(":")
+                d = int(h) * 3600 + int(m) * 60 + float(s)
+            duration = max(duration, float(d or 0))
+        except ValueError:
+            continue
+    return MediaInfo(
+        duration,
+        video[0].get("width") if video else 0,
+        video[0].get("height") if video else 0,
+        source,
+    )
+
+
+async def _header(path: str):
+    # container headers only, nothing past the first couple of MB is read
+    result = await runFFmpeg(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-probesize",
+            str(HEADER_PROBE_SIZE),
+            "-analyzeduration",
+            "0",
+            "-show_entries",
+            "format=duration:stream=codec_type,width,height,duration:stream_tags=DURATION",
+            "-of",
+            "json",
+            path,
+        ],
+        timeout=30,
+        capture_stdout=True,
+    )
+    if not result.ok:
+        return None
+    return _fromStreams(json.loads(result.stdout.decode() or "{}"), "header")
+
+
+async def mediaInfo(path: str, media=None):
+    """
+    Duration and dimensions of a media file from the cheapest source that
+    knows them. A tier that fails or doesn't know the duration falls
+    through to the next one instead of failing the job.
+
+    Parameters:
+    - `path`: Local file.
+    - `media`: Telegram media the file came from, if the caller has it.
+      Files fetched by the downloader are already known without it.
+
+    returns: `MediaInfo`, with a duration of `0` if no tier could read one.
+    """
+    if media is not None:
+        info = fromTelegram(media)
+        if info is not None:
+            return info
+    try:
+        key = fileKey(path)
+    except OSError:
+        return MediaInfo()
+    if key in _infos:
+        _infos.move_to_end(key)
+        return _infos[key]
+    info = None
+    try:
+        info = await _header(path)
+    except Exception as e:
+        LOGGER.info(f"Header probe of {path} failed: {e}")
+    if info is None or not info.complete:
+        summary = await probeMedia(path)
+        if summary is not None:
+            info = _fromStreams(summary, "full")
+    if info is None or not info.complete:
+        LOGGER.warning(f"No duration for {path}")
+        return info or MediaInfo()
+    _remember(path, info)
+    return info
@@ -0,0 +1,95 @@
+import re
+
+from __init__ import LOGGER
+
+from helpers import database
+from helpers.utils import UserSettings
+
+STREAM_KEY = re.compile(r"^([vas])(\d+)\.(\w+)$")
+STREAM_NAMES = {"v": "Video", "a": "Audio", "s": "Subtitle"}
+
+
+def parseMetadata(text: str):
+    """
+    Parses the `/metadata` command text.
+
+    `title=My Movie | author=Me | a1.title=English | a1.language=eng | s2.default`
+
+    Keys without a prefix are global tags, `v`/`a`/`s` with a 1-based
+    track number set tags of that output track, and `.default` makes the
+    track the default one of its type.
+
+    returns: dict with `global`, `streams` and `default`.
+    """
+    meta = {"global": {}, "streams": {}, "default": {}}
+    for item in text.split("|"):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        value = value.strip()
+        if not key:
+            continue
+        match = STREAM_KEY.match(key)
+        if match is None:
+            meta["global"][key] = value
+            continue
+        kind, track, tag = match.group(1), int(match.group(2)) - 1, match.group(3)
+        if track < 0:
+            continue
+        if tag == "default":
+            meta["default"][kind] = track
+        else:
+            meta["streams"].setdefault(f"{kind}:{track}", {})[tag] = value
+    return meta
+
+
+def formatMetadata(meta: dict):
+    """
+    returns: Readable summary of the saved metadata.
+    """
+    lines = [f"┣ {k}: `{v}`" for k, v in meta.get("global", {}).items()]
+    for spec, tags in meta.get("streams", {}).items():
+        kind, track = spec.split(":")
+        for k, v in tags.items():
+            lines.append(f"┣ {STREAM_NAMES[kind]} {int(track)+1} {k}: `{v}`")
+    for kind, track in meta.get("default", {}).items():
+        lines.append(f"┣ Default {STREAM_NAMES[kind]}: `{track+1}`")
+    if not lines:
+        return "No metadata saved"
+    lines[-1] = "┗" + lines[-1][1:]
+    return "\n".join(lines)
+
+
+def metadataArgs(meta: dict):
+    """
+    Turns saved metadata into ffmpeg output options, so tags are written by
+    the same command that produces the file. They go after the bot's own
+    track titles and override them.
+
+    returns: list of arguments, empty if `meta` is `None`.
+    """
+    if not meta:
+        return []
+    args = []
+    for k, v in meta.get("global", {}).items():
+        args += ["-metadata", f"{k}={v}"]
+    for spec, tags in meta.get("streams", {}).items():
+        for k, v in tags.items():
+            args += [f"-metadata:s:{spec}", f"{k}={v}"]
+    for kind, track in meta.get("default", {}).items():
+        # clear the flag on every track of the type, then set the chosen one
+        args += [f"-disposition:{kind}", "0", f"-disposition:{kind}:{track}", "default"]
+    return args
+
+
+async def userMetadata(user_id: int, name: str):
+    """
+    returns: Saved metadata of the user if editing is enabled, else `None`.
+    """
+    user = UserSettings(user_id, name)
+    if not user.edit_metadata:
+        return None
+    try:
+        return await database.getMetadata(user_id)
+    except Exception as err:
+        LOGGER.info(f"Unable to get metadata: {err}")
+        return None
@@ -0,0 +1,119 @@
+import math
+import os
+import shutil
+
+from __init__ import LOGGER
+from config import Config
+from pyrogram import Client
+
+from helpers.downloader import prefetchedSize
+from helpers.splitter import TG_PREMIUM_UPLOAD_LIMIT, uploadLimit
+from helpers.utils import get_readable_file_size, get_readable_time
+
+jobPlanDB = {}  # uid -> JobPlan of the job about to start
+
+
+class JobPlan(object):
+    """
+    What a merge job will need, worked out from the queued messages alone.
+    """
+
+    def __init__(self):
+        self.input_size: int = 0
+        self.output_size: int = 0
+        self.duration: int = 0
+        self.disk_needed: int = 0
+        self.disk_free: int = 0
+        self.streamed: bool = False
+        self.parts: int = 1
+        self.needs_premium: bool = False
+
+    @property
+    def fits_disk(self):
+        return self.disk_needed <= self.disk_free
+
+    @property
+    def needs_split(self):
+        return self.parts > 1
+
+    def summary(self):
+        text = (
+            f"📋 **Job plan**\n"
+            f"┣ Inputs: `{get_readable_file_size(self.input_size)}`\n"
+            f"┣ Output: ~`{get_readable_file_size(self.output_size)}`\n"
+            f"┣ Duration: ~`{get_readable_time(self.duration)}`\n"
+            f"┗ Disk: `{get_readable_file_size(self.disk_needed)}` of "
+            f"`{get_readable_file_size(self.disk_free)}` free"
+        )
+        if self.needs_split:
+            text += (
+                f"\n\n✂️ Over the {get_readable_file_size(uploadLimit())} upload limit, "
+                f"Telegram upload will be split into ~{self.parts} parts or fitted to size"
+            )
+            if self.needs_premium:
+                text += " (a premium account would take it in one file)"
+        return text
+
+
+def _media(m):
+    return m.video or m.document or m.audio
+
+
+async def planJob(c: Client, user_id: int, queue: dict, merge_mode: int):
+    """
+    Estimates a job before anything is downloaded.
+
+    Parameters:
+    - `queue`: The user's `queueDB` entry.
+    - `merge_mode`: Merge mode of the user.
+
+    returns: `JobPlan`
+    """
+    plan = JobPlan()
+    videos = list(queue.get("videos") or [])
+    extras = [i for i in (queue.get("subtitles") or []) + (queue.get("audios") or []) if i]
+    ids = videos + extras
+    if not ids:
+        return plan
+    messages = [
+        m for m in await c.get_messages(chat_id=user_id, message_ids=ids) if not m.empty
+    ]
+    video_msgs = [m for m in messages if m.id in videos and _media(m) is not None]
+    extra_msgs = [m for m in messages if m.id in extras and _media(m) is not None]
+    video_sizes = [_media(m).file_size or 0 for m in video_msgs]
+    extra_size = sum([_media(m).file_size or 0 for m in extra_msgs])
+    plan.input_size = sum(video_sizes) + extra_size
+    durations = [getattr(_media(m), "duration", 0) or 0 for m in video_msgs]
+    if merge_mode == 1:
+        plan.output_size = sum(video_sizes) + extra_size
+        plan.duration = sum(durations)
+        plan.streamed = Config.STREAM_MERGE and not extra_msgs
+    else:
+        # every other mode works on the first video only
+        plan.output_size = (video_sizes[0] if video_sizes else 0) + extra_size
+        plan.duration = durations[0] if durations else 0
+    os.makedirs("downloads", exist_ok=True)
+    plan.disk_free = shutil.disk_usage("downloads").free
+    # prefetched inputs already took their space out of disk_free
+    prefetched = min(prefetchedSize(user_id), plan.input_size)
+    # output plus the split parts next to it
+    plan.disk_needed = 2 * plan.output_size + plan.input_size - prefetched
+    if merge_mode == 1 and not extra_msgs and not plan.fits_disk:
+        # inputs don't fit next to the output, stream them instead
+        plan.streamed = True
+    if plan.streamed:
+        # a streamed job drops the prefetches and never writes its inputs
+        plan.disk_needed = 2 * plan.output_size
+        plan.disk_free += prefetched
+    plan.parts = max(1, math.ceil(plan.output_size / uploadLimit()))
+    plan.needs_premium = (
+        plan.needs_split
+        and not Config.IS_PREMIUM
+        and plan.output_size <= TG_PREMIUM_UPLOAD_LIMIT
+    )
+    jobPlanDB[user_id] = plan
+    LOGGER.info(
+        f"Job plan for {user_id}: in={plan.input_size} out={plan.output_size} "
+        f"disk={plan.disk_needed}/{plan.disk_free} parts={plan.parts}"
+    )
+    return plan
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from fractions import Fraction
+
+from __init__ import LOGGER
+from config import Config
+
+from helpers.ffmpeg_runner import runFFmpeg
+from helpers.keyframes import fileKey
+
+try:
+    # libav bindings, opens containers in-process instead of spawning ffprobe
+    import av
+except ImportError:
+    av = None
+
+CACHE_SLOTS = 256  # probed files kept, a summary is a few hundred bytes
+# all any helper reads from a probe, the rest of ffprobe's output is dropped
+FORMAT_KEYS = ("duration", "size", "bit_rate", "format_name")
+STREAM_KEYS = (
+    "index",
+    "codec_type",
+    "codec_name",
+    "width",
+    "height",
+    "pix_fmt",
+    "r_frame_rate",
+    "sample_rate",
+    "channels",
+    "channel_layout",
+    "bit_rate",
+    "duration",
+)
+TAG_KEYS = ("language", "title", "BPS", "DURATION", "NUMBER_OF_BYTES")
+_probes = OrderedDict()  # key -> summary
+_running = {}  # key -> running probe, so a file is only probed once at a time
+
+
+def summarize(data: dict):
+    """
+    Cuts a full ffprobe result down to the keys the helpers use.
+
+    returns: dict shaped like `ffmpeg.probe` output, with `format` and `streams`.
+    """
+    streams = []
+    for stream in data.get("streams", []):
+        s = {k: stream[k] for k in STREAM_KEYS if k in stream}
+        tags = {k: v for k, v in stream.get("tags", {}).items() if k in TAG_KEYS}
+        if tags:
+            s["tags"] = tags
+        streams.append(s)
+    fmt = data.get("format", {})
+    return {"format": {k: fmt[k] for k in FORMAT_KEYS if k in fmt}, "streams": streams}
+
+
+async def _ffprobe(path: str):
+    result = await runFFmpeg(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_format",
+            "-show_streams",
+            "-of",
+            "json",
+            path,
+        ],
+        timeout=60,
+        capture_stdout=True,
+    )
+    if not result.ok:
+        return None
+    return summarize(json.loads(result.stdout.decode() or "{}"))
+
+
+def _pyav_summary(path: str):
+    # same keys and value types as ffprobe's json, so either backend can
+    # answer the same helpers, e.g. the concat signature compares them
+    with av.open(path) as container:
+        streams = []
+        for stream in container.streams:
+            ctx = stream.codec_context
+            s = {"index": stream.index, "codec_type": stream.type}
+            if ctx is not None and ctx.name:
+                s["codec_name"] = ctx.name
+            if stream.type == "video":
+                s["width"] = ctx.width
+                s["height"] = ctx.height
+                if ctx.format is not None:
+                    s["pix_fmt"] = ctx.format.name
+                rate = getattr(stream, "base_rate", None) or stream.average_rate
+                s["r_frame_rate"] = f"{rate.numerator}/{rate.denominator}" if rate else "0/0"
+            elif stream.type == "audio":
+                s["sample_rate"] = str(ctx.sample_rate)
+                s["channels"] = getattr(ctx, "channels", None) or (
+                    ctx.layout.nb_channels if ctx.layout is not None else 0
+                )
+                if ctx.layout is not None:
+                    s["channel_layout"] = ctx.layout.name
+            bit_rate = getattr(stream, "bit_rate", None) or (
+                ctx.bit_rate if ctx is not None else None
+            )
+            if bit_rate:
+                s["bit_rate"] = str(bit_rate)
+            if stream.duration is not None and stream.time_base is not None:
+                s["duration"] = f"{float(stream.duration * stream.time_base):.6f}"
+            tags = {k: v for k, v in stream.metadata.items() if k in TAG_KEYS}
+            if tags:
+                s["tags"] = tags
+            streams.append(s)
+        fmt = {
+            "format_name": container.format.name,
+            "size": str(os.path.getsize(path)),
+        }
+        if container.duration is not None:
+            fmt["duration"] = f"{float(Fraction(container.duration, av.time_base)):.6f}"
+        if container.bit_rate:
+            fmt["bit_rate"] = str(container.bit_rate)
+    return {"format": fmt, "streams": streams}
+
+
+async def _pyav(path: str):
+    loop = asyncio.get_event_loop()
+    try:
+        # av.open blocks on file reads, keep it off the event loop
+        return await loop.run_in_executor(None, _pyav_summary, path)
+    except Exception as e:
+        LOGGER.info(f"PyAV couldn't open {path}, using ffprobe: {e}")
+        return await _ffprobe(path)
+
+
+BACKENDS = {"ffprobe": _ffprobe, "pyav": _pyav}
+
+
+def probeBackend():
+    """
+    returns: Name of the backend `probeMedia` uses. `PROBE_BACKEND` picks
+    one, by default PyAV when it is installed and ffprobe otherwise.
+    """
+    wanted = Config.PROBE_BACKEND
+    if wanted == "ffprobe" or av is None:
+        if wanted == "pyav":
+            LOGGER.warning("PROBE_BACKEND is pyav but PyAV isn't installed, using ffprobe")
+        return "ffprobe"
+    return "pyav"
+
+
+_backend = probeBackend()
+
+
+async def probeMedia(path: str):
+    """
+    Stream summary of a media file, probed once and then answered from
+    memory for every later helper and job asking about the same file.
+
+    returns: dict like `ffmpeg.probe` output but with only the keys in
+    `FORMAT_KEYS` and `STREAM_KEYS`, or `None` if the file couldn't be probed.
+    """
+    try:
+        key = fileKey(path)
+    except OSError:
+        return None
+    if key in _probes:
+        _probes.move_to_end(key)
+        return _probes[key]
+    if key not in _running:
+        _running[key] = asyncio.ensure_future(BACKENDS[_backend](path))
+    try:
+        summary = await _running[key]
+    except Exception as e:
+        LOGGER.warning(f"Probe of {path} failed: {e}")
+        summary = None
+    finally:
+        _running.pop(key, None)
+    if summary is None:
+        return None
+    _probes[key] = summary
+    while len(_probes) > CACHE_SLOTS:
+        _probes.popitem(last=False)
+    return summary
+
+
+async def probeStreams(path: str, codec_type: str = None):
+    """
+    returns: Streams of the file, only those of `codec_type` if given.
+    """
+    summary = await probeMedia(path)
+    streams = summary["streams"] if summary is not None else []
+    return [s for s in streams if codec_type is None or s.get("codec_type") == codec_type]
+
+
+async def probeDuration(path: str):
+    """
+    returns: Duration of a media file in seconds, `0` if it has none.
+    """
+    summary = await probeMedia(path)
+    try:
+        return float(summary["format"]["duration"])
+    except (TypeError, KeyError, ValueError):
+        return 0
@@ -10,6 +10,8 @@ from pyrogram.errors import FloodWait, MessageNotModified
 from pyrogram.types import CallbackQuery, Message
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from helpers import database
+from helpers.display_progress import Progress
+from helpers.governor import governed, prioritized, reportQueue
 from __init__ import LOGGER
 
 
@@ -121,13 +123,78 @@ class RCUploadTask(Status):
             self._error = error
 
 
+def driveName(conf_path: str):
+    """
+    returns: Name of the first remote in an rclone config.
+    """
+    return open(conf_path, "r").readlines()[0].removesuffix("]\n").removeprefix("[")
+
+
+async def rcloneList(conf_path: str, path: str):
+    """
+    Lists a folder of the user's remote with `rclone lsjson`.
+
+    Parameters:
+    - `path`: Folder on the remote, `""` for its root.
+
+    returns: List of entries as given by rclone (`Path`, `Name`, `Size`, `IsDir`, ...),
+    folders first, or `None` on failure.
+    """
+    listcmd = [
+        "rclone",
+        "lsjson",
+        f"--config={conf_path}",
+        "--no-modtime",
+        "--no-mimetype",
+        f"{driveName(conf_path)}:{path}",
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *listcmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.warning(stderr.decode().strip())
+        return None
+    entries = json.loads(stdout.decode() or "[]")
+    return sorted(entries, key=lambda e: (not e["IsDir"], e["Name"].lower()))
+
+
+async def rcloneCat(conf_path: str, path: str, chunk_size: int = 1024 * 1024):
+    """
+    Reads a file of the user's remote with `rclone cat`.
+
+    returns: Async iterator of chunks of the file.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "rclone",
+        "cat",
+        f"--config={conf_path}",
+        f"{driveName(conf_path)}:{path}",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            chunk = await process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        await process.wait()
+        if process.returncode != 0:
+            raise Exception(f"rclone cat {path} exited with {process.returncode}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
 async def rclone_driver(userMess: Message, cb: CallbackQuery, merged_video_path):
     conf_path = f"./userdata/{cb.from_user.id}/rclone.conf"
     dl_task = None
     ul_task = RCUploadTask(dl_task)
-    DRIVE_NAME = (
-        open(conf_path, "r").readlines()[0].removesuffix("]\n").removeprefix("[")
-    )
+    DRIVE_NAME = driveName(conf_path)
     BASE_DIR = "/"
     edtime = 5
     try:
@@ -180,10 +247,21 @@ async def rclone_upload(
         "--buffer-size=1M",
         "-P",
     ]
-    rclonePr = subprocess.Popen(rclone_copy_cmd, stdout=subprocess.PIPE)
-    rcloneResult = await rclone_process_display(
-        rclonePr, edTime, msg, mess, userMess, task
+    # uploads take an io slot like stream copies, they read the same disk
+    waiting = reportQueue(
+        Progress(cb.from_user.id, cb._client, msg), "io", "☁️ Uploading to drive"
     )
+    async with governed("io", waiting) as acquired:
+        if not acquired:
+            await msg.delete()
+            task.cancel = True
+            return task
+        rclonePr = subprocess.Popen(
+            prioritized(rclone_copy_cmd, "io"), stdout=subprocess.PIPE
+        )
+        rcloneResult = await rclone_process_display(
+            rclonePr, edTime, msg, mess, userMess, task
+        )
     if rcloneResult is False:
         await mess.edit(f"{mess.text} \n Canceled Rclone Upload")
         await msg.delete()
@@ -0,0 +1,114 @@
+import os
+
+from __init__ import LOGGER
+from config import Config
+
+from helpers.ffmpeg_runner import runFFmpeg
+from helpers.keyframes import keyframeIndex
+from helpers.probe import probeDuration
+
+TG_UPLOAD_LIMIT = 2044723200
+TG_PREMIUM_UPLOAD_LIMIT = 4241280205
+
+
+def plannedCuts(index, duration: float, size: int, max_size: int, headroom: float):
+    """
+    Cut times for parts of about `max_size * headroom` bytes.
+    With a keyframe index the cuts sit on the keyframes where the byte
+    offset crosses each budget, else they are spread evenly by duration.
+    """
+    budget = max_size * headroom
+    if index is not None and len(index) and min(index.offsets) >= 0:
+        times = []
+        part_start = 0
+        for n in range(1, len(index)):
+            if index.offsets[n] - part_start > budget:
+                # the previous keyframe is the last one that keeps this part in budget
+                cut = n - 1 if index.offsets[n - 1] > part_start else n
+                times.append(index.times[cut])
+                part_start = index.offsets[cut]
+        if size - part_start <= budget or times:
+            # a hair early, the segment muxer cuts on the first keyframe at or after it
+            return [f"{max(t - 0.001, 0):.3f}" for t in times]
+    seg = duration * budget / size
+    times = []
+    t = seg
+    while t < duration:
+        times.append(f"{t:.3f}")
+        t += seg
+    return times
+
+
+def uploadLimit():
+    """
+    Largest file the active account can upload.
+    """
+    if Config.IS_PREMIUM:
+        return TG_PREMIUM_UPLOAD_LIMIT
+    return TG_UPLOAD_LIMIT
+
+
+async def splitVideo(filePath: str, max_size: int):
+    """
+    Splits a video into parts no bigger than `max_size` with stream copy.
+    Cuts are planned on keyframes from the file's keyframe index, so parts
+    play on their own and nothing is re-encoded.
+
+    Parameters:
+    - `filePath`: Path to the video.
+    - `max_size`: Largest allowed part in bytes.
+
+    returns: Paths of the parts in order, named `<name>.part001.<ext>`,
+    or `None` if the video couldn't be split under the limit.
+    """
+    duration = await probeDuration(filePath)
+    if not duration:
+        return None
+    size = os.path.getsize(filePath)
+    stem, ext = os.path.splitext(filePath)
+    index = await keyframeIndex(filePath)
+    # audio and container overhead between keyframes, start with some headroom
+    headroom = 0.97 if index is not None else 0.9
+    for attempt in range(4):
+        times = plannedCuts(index, duration, size, max_size, headroom)
+        if not times:
+            return [filePath]
+        splitcmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-y",
+            "-i",
+            filePath,
+            "-map",
+            "0",
+            "-c",
+            "copy",
+            "-f",
+            "segment",
+            "-segment_times",
+            ",".join(times),
+            "-segment_start_number",
+            "1",
+            "-reset_timestamps",
+            "1",
+            f"{stem}.part%03d{ext}",
+        ]
+        LOGGER.info(splitcmd)
+        result = await runFFmpeg(splitcmd)
+        parts = sorted(
+            [
+                os.path.join(os.path.dirname(filePath), f)
+                for f in os.listdir(os.path.dirname(filePath) or ".")
+                if f.startswith(os.path.basename(stem) + ".part")
+            ]
+        )
+        if not result.ok or not parts:
+            return None
+        biggest = max([os.path.getsize(p) for p in parts])
+        if biggest <= max_size:
+            return parts
+        LOGGER.info(f"Part of {biggest} bytes is over the limit, splitting smaller")
+        for p in parts:
+            os.remove(p)
+        headroom *= max_size / biggest * 0.95
+    return None
@@ -0,0 +1,193 @@
+import re
+
+import numpy as np
+from __init__ import LOGGER
+
+from helpers.probe import probeDuration
+
+SRT_TIME = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+ASS_TIME = re.compile(r"^(\d+):(\d{1,2}):(\d{1,2})\.(\d{1,2})$")
+ASS_TAGS = re.compile(r"\{[^}]*\}")
+# hours, minutes, seconds, milliseconds
+MS_WEIGHTS = np.array([3600000, 60000, 1000, 1], dtype=np.int64)
+
+
+class SubtitleTrack(object):
+    def __init__(self, kind: str):
+        self.kind: str = kind
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.ends = np.zeros(0, dtype=np.int64)
+        self.texts: list = []
+        # ass only
+        self.header: str = ""
+        self.styles: list = []
+        self.fields: list = []
+        self.fields_format: list = []
+
+
+def _read(path: str):
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        return f.read().replace("\r\n", "\n").replace("\r", "\n")
+
+
+def parseSrt(path: str):
+    track = SubtitleTrack("srt")
+    times = []
+    for block in re.split(r"\n\s*\n", _read(path)):
+        lines = block.strip("\n").split("\n")
+        for n, line in enumerate(lines):
+            match = SRT_TIME.search(line)
+            if match:
+                times.append(
+                    [match.group(g) if g % 4 else match.group(g).ljust(3, "0") for g in range(1, 9)]
+                )
+                track.texts.append("\n".join(lines[n + 1 :]))
+                break
+    if times:
+        t = np.array(times, dtype=np.int64).reshape(-1, 2, 4)
+        track.starts = t[:, 0] @ MS_WEIGHTS
+        track.ends = t[:, 1] @ MS_WEIGHTS
+    return track
+
+
+def parseAss(path: str):
+    track = SubtitleTrack("ass")
+    times = []
+    section = ""
+    header = []
+    fmt = ["Layer", "Start", "End", "Style", "Name", "MarginL", "MarginR", "MarginV", "Effect", "Text"]
+    for line in _read(path).split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("[") and stripped.endswith("]"):
+            section = stripped.lower()
+            if section == "[events]":
+                continue
+        if section == "[events]":
+            if stripped.startswith("Format:"):
+                fmt = [f.strip() for f in stripped[7:].split(",")]
+            elif stripped.startswith("Dialogue:"):
+                values = stripped[9:].strip().split(",", len(fmt) - 1)
+                if len(values) != len(fmt):
+                    continue
+                start = ASS_TIME.match(values[fmt.index("Start")])
+                end = ASS_TIME.match(values[fmt.index("End")])
+                if not (start and end):
+                    continue
+                times.append(
+                    [*start.groups()[:3], start.group(4).ljust(2, "0") + "0",
+                     *end.groups()[:3], end.group(4).ljust(2, "0") + "0"]
+                )
+                track.fields.append(values)
+                track.texts.append(values[-1])
+            continue
+        if section.endswith("styles]") and stripped.startswith("Style:"):
+            track.styles.append(stripped)
+        header.append(line)
+    track.header = "\n".join(header).strip("\n")
+    track.fields_format = fmt
+    if times:
+        t = np.array(times, dtype=np.int64).reshape(-1, 2, 4)
+        track.starts = t[:, 0] @ MS_WEIGHTS
+        track.ends = t[:, 1] @ MS_WEIGHTS
+    return track
+
+
+def parseSubtitle(path: str):
+    if path.lower().endswith((".ass", ".ssa")):
+        return parseAss(path)
+    return parseSrt(path)
+
+
+def _split_ms(ms: np.ndarray):
+    h, rem = np.divmod(ms, 3600000)
+    m, rem = np.divmod(rem, 60000)
+    s, ms = np.divmod(rem, 1000)
+    return h, m, s, ms
+
+
+def _write_srt(starts, ends, texts, output_path):
+    sh, sm, ss, sms = _split_ms(starts)
+    eh, em, es, ems = _split_ms(ends)
+    with open(output_path, "w", encoding="utf-8") as f:
+        for n in range(len(texts)):
+            f.write(
+                f"{n+1}\n"
+                f"{sh[n]:02d}:{sm[n]:02d}:{ss[n]:02d},{sms[n]:03d} --> "
+                f"{eh[n]:02d}:{em[n]:02d}:{es[n]:02d},{ems[n]:03d}\n"
+                f"{texts[n]}\n\n"
+            )
+
+
+def _write_ass(tracks, starts, ends, output_path):
+    first = tracks[0]
+    fmt = first.fields_format
+    names = set([style.split(",", 1)[0] for style in first.styles])
+    extra = []
+    for t in tracks[1:]:
+        for style in t.styles:
+            if style.split(",", 1)[0] not in names:
+                names.add(style.split(",", 1)[0])
+                extra.append(style)
+    fields = [v for t in tracks for v in t.fields]
+    sh, sm, ss, sms = _split_ms(starts)
+    eh, em, es, ems = _split_ms(ends)
+    header = first.header.split("\n")
+    if extra and first.styles:
+        # styles of later files go right after the first file's own styles
+        last = max([n for n, line in enumerate(header) if line.strip().startswith("Style:")])
+        header[last + 1 : last + 1] = extra
+    lines = header + ["", "[Events]", "Format: " + ", ".join(fmt)]
+    for n, values in enumerate(fields):
+        values = list(values)
+        values[fmt.index("Start")] = f"{sh[n]}:{sm[n]:02d}:{ss[n]:02d}.{sms[n]//10:02d}"
+        values[fmt.index("End")] = f"{eh[n]}:{em[n]:02d}:{es[n]:02d}.{ems[n]//10:02d}"
+        lines.append("Dialogue: " + ",".join(values))
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+async def combineSubtitles(sub_paths: list, video_paths: list, output_path: str):
+    """
+    Joins the subtitles of several videos into one track for the merged video.
+    Every file is parsed once and its timestamps are shifted by the total
+    duration of the videos before it.
+
+    Parameters:
+    - `sub_paths`: Subtitle path for each video, `None` where a video has none.
+    - `video_paths`: Paths of the videos in merge order.
+    - `output_path`: Path without extension for the combined subtitle.
+
+    returns: Path of the combined subtitle, or `None` if there is nothing to combine.
+    """
+    tracks = []
+    offset = 0
+    for sub_path, video_path in zip(sub_paths, video_paths):
+        if sub_path is not None:
+            try:
+                tracks.append((parseSubtitle(sub_path), offset))
+            except Exception as e:
+                LOGGER.warning(f"Skipping subtitle {sub_path}: {e}")
+        duration = await probeDuration(video_path)
+        offset += int(round(duration * 1000))
+    tracks = [(t, o) for t, o in tracks if len(t.texts)]
+    if not tracks:
+        return None
+    starts = np.concatenate([t.starts + o for t, o in tracks])
+    ends = np.concatenate([t.ends + o for t, o in tracks])
+    tracks = [t for t, _ in tracks]
+    if all(t.kind == "ass" for t in tracks):
+        output_path += ".ass"
+        _write_ass(tracks, starts, ends, output_path)
+    else:
+        texts = []
+        for t in tracks:
+            if t.kind == "ass":
+                texts += [ASS_TAGS.sub("", x).replace("\\N", "\n").replace("\\n", "\n") for x in t.texts]
+            else:
+                texts += t.texts
+        output_path += ".srt"
+        _write_srt(starts, ends, texts, output_path)
+    LOGGER.info(f"Combined {len(tracks)} subtitles into {output_path}")
+    return output_path
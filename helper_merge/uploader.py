@@ -36,6 +36,7 @@ async def uploadVideo(
                     width=width,
                     duration=duration,
                     thumb=video_thumbnail,
+                    supports_streaming=True,
                     caption=f"`{merged_video_path.rsplit('/',1)[-1]}`\n\nMerged for: {cb.from_user.mention}",
                     progress=prog.progress_for_pyrogram,
                     progress_args=(
@@ -77,6 +78,7 @@ async def uploadVideo(
                     width=width,
                     duration=duration,
                     thumb=video_thumbnail,
+                    supports_streaming=True,
                     caption=f"`{merged_video_path.rsplit('/',1)[-1]}`",
                     progress=prog.progress_for_pyrogram,
                     progress_args=(
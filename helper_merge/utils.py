@@ -54,12 +54,47 @@ def get_readable_time(seconds: int) -> str:
     seconds = int(seconds)
     result += f"{seconds}s"
     return result
+
+def parse_timestamp(text: str) -> float:
+    """
+    Reads `SS`, `MM:SS` or `HH:MM:SS`, seconds may have a fraction.
+    """
+    seconds = 0.0
+    for part in text.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_ranges(text: str) -> list:
+    """
+    Reads ranges like `0:30-2:30, 10:00-12:15`.
+
+    returns: List of `(start, end)` in seconds, sorted, or `None` if any
+    range is malformed, empty or overlaps another.
+    """
+    ranges = []
+    try:
+        for part in text.replace("\n", ",").split(","):
+            if not part.strip():
+                continue
+            start, end = part.split("-")
+            ranges.append((parse_timestamp(start), parse_timestamp(end)))
+    except ValueError:
+        return None
+    ranges.sort()
+    for n, (start, end) in enumerate(ranges):
+        if start < 0 or end <= start or (n and start < ranges[n - 1][1]):
+            return None
+    return ranges or None
+
 class UserSettings(object):
     def __init__(self, uid: int, name:str):
         self.user_id: int = uid
         self.name: str = name
         self.merge_mode: int = 1
         self.edit_metadata: bool = False
+        self.fit_to_size: bool = False
+        self.output_formats: str = "mkv"
+        self.audio_sync: bool = False
         self.allowed: bool = False
         self.thumbnail = None
         self.banned:bool = False
@@ -73,6 +108,9 @@ class UserSettings(object):
                 self.name = cur["name"]
                 self.merge_mode = cur["user_settings"]["merge_mode"]
                 self.edit_metadata = cur["user_settings"]["edit_metadata"]
+                self.fit_to_size = cur["user_settings"].get("fit_to_size", False)
+                self.output_formats = cur["user_settings"].get("output_formats", "mkv")
+                self.audio_sync = cur["user_settings"].get("audio_sync", False)
                 self.allowed = cur["isAllowed"]
                 self.thumbnail = cur["thumbnail"]
                 self.banned = cur["isBanned"]
@@ -82,6 +120,9 @@ class UserSettings(object):
                     "user_settings": {
                         "merge_mode": self.merge_mode,
                         "edit_metadata": self.edit_metadata,
+                        "fit_to_size": self.fit_to_size,
+                        "output_formats": self.output_formats,
+                        "audio_sync": self.audio_sync,
                     },
                     "isAllowed": self.allowed,
                     "isBanned": self.banned,
@@ -100,5 +141,8 @@ class UserSettings(object):
             banned=self.banned,
             allowed=self.allowed,
             thumbnail=self.thumbnail,
+            fit_to_size=self.fit_to_size,
+            output_formats=self.output_formats,
+            audio_sync=self.audio_sync,
         )
         return self.get()
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+from __init__ import LOGGER, formatDB, queueDB
+
+
+def jobDir(user_id: int, job_id: int = None):
+    """
+    Working directory of one job, so a user's jobs never share file names.
+
+    Parameters:
+    - `job_id`: Id of the job's status message, `None` for the user's root.
+
+    returns: Path of the directory, created if missing.
+    """
+    path = f"downloads/{str(user_id)}"
+    if job_id is not None:
+        path += f"/job{str(job_id)}"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def takeQueue(user_id: int):
+    """
+    Hands the user's queue over to a job and starts an empty one,
+    so the next job can be queued while this one runs.
+
+    returns: The queue the job should work on.
+    """
+    queue = queueDB.get(user_id) or {"videos": [], "subtitles": [], "audios": []}
+    queueDB.update({user_id: {"videos": [], "subtitles": [], "audios": []}})
+    formatDB.update({user_id: None})
+    return queue
+
+
+def queueIds(queue: dict):
+    """
+    returns: Every message id in a queue.
+    """
+    return [
+        i for k in ("videos", "subtitles", "audios") for i in (queue.get(k) or []) if i
+    ]
+
+
+async def cleanupJob(user_id: int, job_id: int, message_ids: list = None):
+    """
+    Removes a job's workspace and the downloads of its queued messages,
+    leaving the user's other jobs alone.
+    """
+    paths = [jobDir(user_id, job_id)]
+    paths += [f"downloads/{str(user_id)}/{str(mid)}" for mid in (message_ids or [])]
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+    LOGGER.info(f"Cleaned up job {job_id} of {user_id}")
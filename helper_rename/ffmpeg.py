@@ -1,10 +1,8 @@
 import time
 import os
-import asyncio
 from PIL import Image
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
 from pyrogram.types import Message
+from helpers.ffmpeg_runner import runFFmpeg
 
 
 async def fix_thumb(thumb):
@@ -12,15 +10,9 @@ async def fix_thumb(thumb):
     height = 0
     try:
         if thumb != None:
-            parser = createParser(thumb)
-            metadata = extractMetadata(parser)
-            if metadata.has("width"):
-                width = metadata.get("width")
-            if metadata.has("height"):
-                height = metadata.get("height")
-                
             # Open the image file
             with Image.open(thumb) as img:
+                width, height = img.size
                 # Convert the image to RGB format and save it back to the same file
                 img.convert("RGB").save(thumb)
             
@@ -29,7 +21,6 @@ async def fix_thumb(thumb):
                 
                 # Save the resized image in JPEG format
                 resized_img.save(thumb, "JPEG")
-            parser.close()
     except Exception as e:
         print(e)
         thumb = None 
@@ -48,14 +39,7 @@ async def take_screen_shot(video_file, output_directory, ttl):
         "1",
         out_put_file_name
     ]
-    process = await asyncio.create_subprocess_exec(
-        *file_genertor_command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
+    await runFFmpeg(file_genertor_command, timeout=120)
     if os.path.lexists(out_put_file_name):
         return out_put_file_name
     return None
@@ -75,16 +59,9 @@ async def add_metadata(input_path, output_path, metadata, ms):
             output_path
         ]
         
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate()
-        e_response = stderr.decode().strip()
-        t_response = stdout.decode().strip()
-        print(e_response)
-        print(t_response)
+        result = await runFFmpeg(command)
+        if not result.ok:
+            print(result.tail)
 
         
         if os.path.exists(output_path):
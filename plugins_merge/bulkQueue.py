@@ -0,0 +1,166 @@
+from __init__ import (AUDIO_EXTENSIONS, LOGGER, SUBTITLE_EXTENSIONS,
+                      VIDEO_EXTENSIONS, queueDB)
+from bot import LOGCHANNEL, userBot
+from config import Config
+from helpers.downloader import schedulePrefetch
+from helpers.utils import UserSettings
+from pyrogram import Client
+from pyrogram.types import Message
+
+FETCH_BATCH = 200  # most ids get_messages takes in one call
+FORWARD_BATCH = 100  # most ids forward_messages takes in one call
+MAX_BULK_RANGE = 1000  # ids one command may read, each batch is an API call
+
+USAGE = f"""
+<b>Usage:</b>
+`/bulk <chat> <first id>-<last id>`
+
+┣ `<chat>`: channel username, `-100…` id or a `t.me/c/…` link
+┣ Every video, audio and subtitle in the range is added to the queue in order
+┗ At most {MAX_BULK_RANGE} messages per command
+"""
+
+
+def _chunks(items: list, size: int):
+    for n in range(0, len(items), size):
+        yield items[n : n + size]
+
+
+def parseBulk(text: str):
+    """
+    returns: `(chat, first_id, last_id)` from the command text, or `None`.
+    """
+    args = text.split()[1:]
+    if len(args) != 2 or "-" not in args[1]:
+        return None
+    chat = args[0].removeprefix("https://").removeprefix("t.me/").removeprefix("c/")
+    chat = chat.split("/")[0]
+    if chat.lstrip("-").isdigit():
+        chat = int(chat) if chat.startswith("-") else int(f"-100{chat}")
+    first, _, last = args[1].partition("-")
+    if not (first.isdigit() and last.isdigit()) or int(first) > int(last):
+        return None
+    return chat, int(first), int(last)
+
+
+def _kind(m: Message):
+    media = m.video or m.document or m.audio
+    if media is None:
+        return None
+    ext = media.file_name.rsplit(".", 1)[-1].lower() if media.file_name else "mkv"
+    if m.video is not None or ext in VIDEO_EXTENSIONS:
+        return "videos"
+    if ext in SUBTITLE_EXTENSIONS:
+        return "subtitles"
+    if m.audio is not None or ext in AUDIO_EXTENSIONS:
+        return "audios"
+    return None
+
+
+async def fetchMedia(client: Client, chat, first: int, last: int):
+    """
+    Gets every media message of the range, `FETCH_BATCH` ids per call.
+    """
+    found = []
+    for ids in _chunks(list(range(first, last + 1)), FETCH_BATCH):
+        for m in await client.get_messages(chat_id=chat, message_ids=ids):
+            if m is not None and not m.empty and _kind(m) is not None:
+                found.append(m)
+    return found
+
+
+async def forwardAll(client: Client, to_chat, from_chat, ids: list):
+    """
+    returns: Forwarded copies in the same order, `FORWARD_BATCH` per call.
+    """
+    copies = []
+    for batch in _chunks(ids, FORWARD_BATCH):
+        sent = await client.forward_messages(
+            chat_id=to_chat, from_chat_id=from_chat, message_ids=batch
+        )
+        copies += sent if isinstance(sent, list) else [sent]
+    return copies
+
+
+def enqueueMessage(uid: int, m: Message, merge_mode: int):
+    """
+    Adds a message to the queue the way the merge modes read it.
+
+    returns: Queue key it went to, or `None` if it doesn't fit the mode.
+    """
+    queue = queueDB.setdefault(uid, {"videos": [], "subtitles": [], "audios": []})
+    kind = _kind(m)
+    if kind == "videos":
+        queue["videos"].append(m.id)
+        if merge_mode == 1:
+            queue["subtitles"].append(None)
+    elif kind == "subtitles":
+        if merge_mode == 1:
+            # pair an episode with the subtitle right after it
+            if not queue["videos"] or queue["subtitles"][-1] is not None:
+                return None
+            queue["subtitles"][-1] = m.id
+        elif merge_mode in (3, 5):
+            queue["subtitles"].append(m.id)
+        else:
+            return None
+    elif kind == "audios" and merge_mode in (2, 5):
+        queue["audios"].append(m.id)
+    else:
+        return None
+    return kind
+
+
+async def bulkEnqueue(c: Client, m: Message):
+    parsed = parseBulk(m.text)
+    if parsed is None:
+        await m.reply_text(USAGE, quote=True)
+        return
+    chat, first, last = parsed
+    if last - first + 1 > MAX_BULK_RANGE:
+        await m.reply_text(
+            f"❌ That's {last - first + 1} messages, send at most {MAX_BULK_RANGE} per command",
+            quote=True,
+        )
+        return
+    editable = await m.reply_text(f"🔎 Fetching messages {first}-{last} ...", quote=True)
+    try:
+        messages = await fetchMedia(c, chat, first, last)
+        # the bot can read it, copy the media straight to the user
+        copies = await forwardAll(c, m.chat.id, chat, [i.id for i in messages])
+    except Exception as err:
+        if not Config.USER_SESSION_STRING or Config.LOGCHANNEL is None:
+            await editable.edit(f"❌ Unable to read `{chat}`: {err}")
+            return
+        LOGGER.info(f"Bot can't read {chat}, using user session: {err}")
+        try:
+            async with userBot:
+                messages = await fetchMedia(userBot, chat, first, last)
+                relayed = await forwardAll(
+                    userBot, int(LOGCHANNEL), chat, [i.id for i in messages]
+                )
+            # the bot can only download what is in chats it is part of
+            copies = await forwardAll(
+                c, m.chat.id, int(LOGCHANNEL), [i.id for i in relayed]
+            )
+        except Exception as err:
+            await editable.edit(f"❌ Unable to read `{chat}`: {err}")
+            return
+    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    added = {"videos": 0, "subtitles": 0, "audios": 0}
+    skipped = 0
+    for copy in copies:
+        kind = enqueueMessage(m.from_user.id, copy, user.merge_mode)
+        if kind is None:
+            skipped += 1
+            continue
+        added[kind] += 1
+        schedulePrefetch(c, m.from_user.id, copy, user.merge_mode)
+    LOGGER.info(f"Bulk enqueue for {m.from_user.id}: {added}, skipped {skipped}")
+    await editable.edit(
+        f"✅ Added to queue from `{chat}`\n"
+        f"┣ Videos: {added['videos']}\n"
+        f"┣ Audios: {added['audios']}\n"
+        f"┣ Subtitles: {added['subtitles']}\n"
+        f"┗ Skipped: {skipped}"
+    )
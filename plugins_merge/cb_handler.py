@@ -5,15 +5,16 @@ from bot import (
     LOGGER,
     UPLOAD_AS_DOC,
     UPLOAD_TO_DRIVE,
-    delete_all,
-    formatDB,
     gDict,
     queueDB,
     showQueue,
     mergeApp
 )
 from helpers import database
+from helpers.downloader import cancelPrefetch, schedulePrefetch
+from helpers.planner import planJob
 from helpers.utils import UserSettings
+from helpers.workspace import cleanupJob, jobDir, queueIds, takeQueue
 from pyrogram import Client, filters
 from pyrogram.types import (
     CallbackQuery,
@@ -22,10 +23,15 @@ from pyrogram.types import (
     Message,
 )
 
+from plugins.compressVideo import compressNow
 from plugins.mergeVideo import mergeNow
 from plugins.mergeVideoAudio import mergeAudio
+from plugins.mergeVideoAudioSub import mergeAudioSub
+from plugins.mergeArchive import archiveCallback, hasArchiveJob, mergeArchive
+from plugins.mergeRemote import driveCallback, hasRemoteJob, mergeRemote
 from plugins.mergeVideoSub import mergeSub
 from plugins.streams_extractor import streamsExtractor
+from plugins.trimVideo import trimNow
 from plugins.usettings import userSettings
 
 
@@ -34,8 +40,26 @@ async def callback_handler(c: Client, cb: CallbackQuery):
     #     await cb_handler.cb_handler(c, cb)
     # async def cb_handler(c: Client, cb: CallbackQuery):
     if cb.data == "merge":
+        user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+        try:
+            plan = await planJob(
+                c, cb.from_user.id, queueDB.get(cb.from_user.id, {}), user.merge_mode
+            )
+        except Exception as err:
+            LOGGER.info(f"Unable to plan job: {err}")
+            plan = None
+        if plan is not None and not plan.fits_disk:
+            await cb.message.edit(
+                f"{plan.summary()}\n\n❌ Not enough disk space for this job, remove some files and try again",
+                reply_markup=InlineKeyboardMarkup(
+                    [[InlineKeyboardButton("⛔ Cancel ⛔", callback_data="cancel")]]
+                ),
+            )
+            return
         await cb.message.edit(
-            text="Where do you want to upload?",
+            text=f"{plan.summary()}\n\nWhere do you want to upload?"
+            if plan is not None
+            else "Where do you want to upload?",
             reply_markup=InlineKeyboardMarkup(
                 [
                     [
@@ -60,11 +84,9 @@ async def callback_handler(c: Client, cb: CallbackQuery):
             await cb.message.reply_text("Rclone not Found, Unable to upload to drive")
         if os.path.exists(f"userdata/{cb.from_user.id}/rclone.conf") is False:
             await cb.message.delete()
-            await delete_all(root=f"downloads/{cb.from_user.id}/")
-            queueDB.update(
-                {cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}}
-            )
-            formatDB.update({cb.from_user.id: None})
+            cancelPrefetch(cb.from_user.id)
+            queue = takeQueue(cb.from_user.id)
+            await cleanupJob(cb.from_user.id, cb.message.id, queueIds(queue))
             return
         UPLOAD_TO_DRIVE.update({f"{cb.from_user.id}": True})
         await cb.message.edit(
@@ -152,31 +174,54 @@ async def callback_handler(c: Client, cb: CallbackQuery):
                 (cb.message.chat.id,None,None), filters=filters.text, timeout=150
             )
             if res.text:
-                new_file_name = f"downloads/{str(cb.from_user.id)}/{res.text}.mkv"
+                new_file_name = f"{jobDir(cb.from_user.id, cb.message.id)}/{res.text}.mkv"
                 await res.delete(True)
-            if user.merge_mode == 1:
+            if hasRemoteJob(cb.from_user.id):
+                await mergeRemote(c, cb, new_file_name)
+            elif hasArchiveJob(cb.from_user.id, cb.message.id):
+                await mergeArchive(c, cb, new_file_name)
+            elif user.merge_mode == 1:
                 await mergeNow(c, cb, new_file_name)
             elif user.merge_mode == 2:
                 await mergeAudio(c, cb, new_file_name)
             elif user.merge_mode == 3:
                 await mergeSub(c, cb, new_file_name)
+            elif user.merge_mode == 5:
+                await mergeAudioSub(c, cb, new_file_name)
+            elif user.merge_mode == 6:
+                await compressNow(c, cb, new_file_name)
+            elif user.merge_mode == 7:
+                await trimNow(c, cb, new_file_name)
 
             return
         if "NO" in cb.data:
             new_file_name = (
-                f"downloads/{str(cb.from_user.id)}/[@INFINITY_BOTZZ]_merged.mkv"
+                f"{jobDir(cb.from_user.id, cb.message.id)}/[@INFINITY_BOTZZ]_merged.mkv"
             )
-            if user.merge_mode == 1:
+            if hasRemoteJob(cb.from_user.id):
+                await mergeRemote(c, cb, new_file_name)
+            elif hasArchiveJob(cb.from_user.id, cb.message.id):
+                await mergeArchive(c, cb, new_file_name)
+            elif user.merge_mode == 1:
                 await mergeNow(c, cb, new_file_name)
             elif user.merge_mode == 2:
                 await mergeAudio(c, cb, new_file_name)
             elif user.merge_mode == 3:
                 await mergeSub(c, cb, new_file_name)
+            elif user.merge_mode == 5:
+                await mergeAudioSub(c, cb, new_file_name)
+            elif user.merge_mode == 6:
+                await compressNow(c, cb, new_file_name)
+            elif user.merge_mode == 7:
+                await trimNow(c, cb, new_file_name)
 
     elif cb.data == "cancel":
-        await delete_all(root=f"downloads/{cb.from_user.id}/")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
+        if hasArchiveJob(cb.from_user.id, cb.message.id):
+            await archiveCallback(c, cb)
+            return
+        cancelPrefetch(cb.from_user.id)
+        queue = takeQueue(cb.from_user.id)
+        await cleanupJob(cb.from_user.id, cb.message.id, queueIds(queue))
         await cb.message.edit("Sucessfully Cancelled")
         await asyncio.sleep(5)
         await cb.message.delete(True)
@@ -189,6 +234,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
             await c.answer_callback_query(
                 cb.id, text="Going to Cancel . . . 🛠", show_alert=False
             )
+            # the job sees the flag, stops its ffmpeg and removes its own files
             gDict[int(chat_id)].append(int(mes_id))
         else:
             await c.answer_callback_query(
@@ -197,9 +243,6 @@ async def callback_handler(c: Client, cb: CallbackQuery):
                 show_alert=True,
                 cache_time=0,
             )
-        await delete_all(root=f"downloads/{cb.from_user.id}/")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
         return
 
     elif cb.data == "close":
@@ -335,7 +378,16 @@ async def callback_handler(c: Client, cb: CallbackQuery):
                     quote=True,
                 )
                 return
+            oldSub = queueDB.get(cb.from_user.id)["subtitles"][sIndex]
+            if oldSub is not None:
+                cancelPrefetch(cb.from_user.id, oldSub)
             queueDB.get(cb.from_user.id)["subtitles"][sIndex] = subs.id
+            schedulePrefetch(
+                c,
+                cb.from_user.id,
+                subs,
+                UserSettings(cb.from_user.id, cb.from_user.first_name).merge_mode,
+            )
             await subs.reply_text(
                 f"Added {subs.document.file_name}",
                 reply_markup=InlineKeyboardMarkup(
@@ -356,6 +408,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
     elif cb.data.startswith("removeSub_"):
         sIndex = int(cb.data.rsplit("_")[-1])
         vMessId = queueDB.get(cb.from_user.id)["videos"][sIndex]
+        cancelPrefetch(cb.from_user.id, queueDB.get(cb.from_user.id)["subtitles"][sIndex])
         queueDB.get(cb.from_user.id)["subtitles"][sIndex] = None
         await cb.message.edit(
             text=f"Subtitle Removed Now go back or send next video",
@@ -381,6 +434,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
             int(cb.data.split("_", 1)[-1])
         )
         queueDB.get(cb.from_user.id)["videos"].remove(int(cb.data.split("_", 1)[-1]))
+        cancelPrefetch(cb.from_user.id, int(cb.data.split("_", 1)[-1]))
         await showQueue(c, cb)
         return
 
@@ -408,6 +462,44 @@ async def callback_handler(c: Client, cb: CallbackQuery):
             cb.message, uid, cb.from_user.first_name, cb.from_user.last_name, user
         )
         return
+
+    elif cb.data.startswith("chFormats_"):
+        uid = int(cb.data.split("_")[1])
+        user = UserSettings(uid, cb.from_user.first_name)
+        user.output_formats = cb.data.split("_")[2]
+        user.set()
+        await userSettings(
+            cb.message, uid, cb.from_user.first_name, cb.from_user.last_name, user
+        )
+        return
+
+    elif cb.data.startswith("drv_"):
+        await driveCallback(c, cb)
+        return
+
+    elif cb.data.startswith("arc_"):
+        await archiveCallback(c, cb)
+        return
+
+    elif cb.data.startswith("toggleFit_"):
+        uid = int(cb.data.split("_")[1])
+        user = UserSettings(uid, cb.from_user.first_name)
+        user.fit_to_size = False if user.fit_to_size else True
+        user.set()
+        await userSettings(
+            cb.message, uid, cb.from_user.first_name, cb.from_user.last_name, user
+        )
+        return
+
+    elif cb.data.startswith("toggleSync_"):
+        uid = int(cb.data.split("_")[1])
+        user = UserSettings(uid, cb.from_user.first_name)
+        user.audio_sync = False if user.audio_sync else True
+        user.set()
+        await userSettings(
+            cb.message, uid, cb.from_user.first_name, cb.from_user.last_name, user
+        )
+        return
     
     elif cb.data.startswith('extract'):
         edata = cb.data.split('_')[1]
@@ -0,0 +1,57 @@
+import asyncio
+
+from bot import LOGGER, gDict
+from helpers.downloader import downloadAll, queuePath
+from helpers.encoder import CompressVideo
+from helpers.metadata import userMetadata
+from helpers.media_info import mediaInfo
+from helpers.workspace import cleanupJob, queueIds, takeQueue
+from plugins.uploadMerged import uploadMerged
+from pyrogram import Client
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import CallbackQuery, Message
+
+
+async def compressNow(c: Client, cb: CallbackQuery, new_file_name: str):
+    omess = cb.message.reply_to_message
+    await cb.message.edit("⭕ Processing...")
+    # the queue now belongs to this job, the user can start the next one
+    queue = takeQueue(cb.from_user.id)
+    job_inputs = queueIds(queue)
+    job_id = cb.message.id
+    user_meta = await userMetadata(cb.from_user.id, cb.from_user.first_name)
+    if not queue["videos"]:
+        await cb.answer("Queue Empty", show_alert=True)
+        await cb.message.delete(True)
+        return
+    video_mess = queue["videos"][0]
+    i: Message = await c.get_messages(chat_id=cb.from_user.id, message_ids=video_mess)
+    await cb.message.edit(f"📥 Starting Download of ... `{(i.video or i.document).file_name}`")
+    paths = await downloadAll(c, cb, [(i, queuePath(cb.from_user.id, i))])
+    if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    if paths[0] is None:
+        await cb.message.edit("❌ Failed to download video !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    duration = (await mediaInfo(paths[0])).duration
+    if not duration:
+        await cb.message.edit("❌ Unable to read video duration !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    muxed_video = await CompressVideo(
+        c, cb, paths[0], duration, cb.from_user.id, job_id=job_id, metadata=user_meta
+    )
+    if muxed_video is None:
+        await cb.message.edit("❌ Failed to compress video !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    try:
+        await cb.message.edit("✅ Sucessfully Compressed Video !")
+    except MessageNotModified:
+        await cb.message.edit("Sucessfully Compressed Video ! ✅")
+    LOGGER.info(f"Video compressed for: {cb.from_user.first_name} ")
+    await asyncio.sleep(3)
+    await uploadMerged(c, cb, omess, muxed_video, new_file_name, job_id, job_inputs)
+    return
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import shutil
+import time
+
+from __init__ import LOGGER, archiveDB, gDict
+from helpers.archive import classifyMembers, listArchive
+from helpers.display_progress import Progress
+from helpers.ffmpeg_helper import MergeArchiveStream, completeTeeOutputs
+from helpers.metadata import userMetadata
+from helpers.utils import UserSettings, get_readable_file_size
+from helpers.workspace import cleanupJob, jobDir
+from plugins.uploadMerged import uploadMerged
+from pyrogram import Client
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import (CallbackQuery, InlineKeyboardButton,
+                            InlineKeyboardMarkup, Message)
+
+
+async def archiveInput(c: Client, m: Message):
+    """
+    Takes a season pack sent as one archive. The archive is the only copy
+    on disk, its videos are decompressed straight into the merge.
+    """
+    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    if user.merge_mode != 1:
+        await m.reply_text(
+            "❗ Archives can only be merged in video-video mode, change it in /settings",
+            quote=True,
+        )
+        return
+    media = m.document
+    editable = await m.reply_text("📥 Downloading archive ...", quote=True)
+    # the status message becomes the job, keep the archive in its workspace
+    workspace = jobDir(m.from_user.id, editable.id)
+    archive = f"{workspace}/archive.{media.file_name.rsplit('.', 1)[-1].lower()}"
+    if shutil.disk_usage(workspace).free < (media.file_size or 0):
+        await editable.edit("❌ Not enough disk space for this archive")
+        await cleanupJob(m.from_user.id, editable.id)
+        return
+    try:
+        c_time = time.time()
+        prog = Progress(m.from_user.id, c, editable)
+        await c.download_media(
+            message=media,
+            file_name=archive,
+            progress=prog.progress_for_pyrogram,
+            progress_args=(f"🚀 Downloading: `{media.file_name}`", c_time),
+        )
+    except Exception as downloadErr:
+        LOGGER.warning(f"Failed to download archive: {downloadErr}")
+        await editable.edit("❌ Failed to download archive")
+        await cleanupJob(m.from_user.id, editable.id)
+        return
+    if gDict[editable.chat.id] and editable.id in gDict[editable.chat.id]:
+        await cleanupJob(m.from_user.id, editable.id)
+        return
+    entries = await listArchive(archive)
+    if entries is None:
+        await editable.edit("❌ Unable to read this archive")
+        await cleanupJob(m.from_user.id, editable.id)
+        return
+    kinds = classifyMembers(entries)
+    if len(kinds["videos"]) < 2:
+        await editable.edit(
+            f"❌ Found {len(kinds['videos'])} videos in the archive, need at least 2"
+        )
+        await cleanupJob(m.from_user.id, editable.id)
+        return
+    archiveDB[m.from_user.id] = {
+        "archive": archive,
+        "job_id": editable.id,
+        "videos": kinds["videos"],
+    }
+    listing = "\n".join(
+        [
+            f"{n}. `{e['Path']}` [{get_readable_file_size(e['Size'])}]"
+            for n, e in enumerate(kinds["videos"], start=1)
+        ]
+    )
+    skipped = len(kinds["audios"]) + len(kinds["subtitles"]) + len(kinds["other"])
+    await editable.edit(
+        text=f"🗜 **Videos in archive:**\n{listing}\n\n"
+        f"Skipped {skipped} other files, they can't go into a streamed merge.\n\n"
+        f"Where do you want to upload?",
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton("📤 To Telegram", callback_data="to_telegram"),
+                    InlineKeyboardButton("🌫️ To Drive", callback_data="to_drive"),
+                ],
+                [InlineKeyboardButton("⛔ Cancel ⛔", callback_data="arc_cancel")],
+            ]
+        ),
+    )
+
+
+async def archiveCallback(c: Client, cb: CallbackQuery):
+    state = archiveDB.pop(cb.from_user.id, None)
+    if state is not None:
+        await cleanupJob(cb.from_user.id, state["job_id"])
+    await cb.message.edit("Sucessfully Cancelled")
+    await asyncio.sleep(5)
+    await cb.message.delete(True)
+
+
+def hasArchiveJob(uid: int, job_id: int):
+    return archiveDB.get(uid, {}).get("job_id") == job_id
+
+
+async def mergeArchive(c: Client, cb: CallbackQuery, new_file_name: str):
+    omess = cb.message.reply_to_message
+    state = archiveDB.pop(cb.from_user.id)
+    job_id = state["job_id"]
+    await cb.message.edit("⭕ Processing...")
+    user_meta = await userMetadata(cb.from_user.id, cb.from_user.first_name)
+    user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+    formats = user.output_formats.split("+")
+    new_file_name = f"{os.path.splitext(new_file_name)[0]}.{formats[0]}"
+    LOGGER.info(f"Archive merge for user {cb.from_user.id}: {state['videos']}")
+    merged_video_path = await MergeArchiveStream(
+        c=c,
+        archive=state["archive"],
+        entries=[(e["Path"], e["Size"]) for e in state["videos"]],
+        user_id=cb.from_user.id,
+        message=cb.message,
+        format_=formats[0],
+        job_id=job_id,
+        metadata=user_meta,
+        extra_formats=formats[1:],
+    )
+    # the archive isn't needed any more, free the space before uploading
+    if os.path.exists(state["archive"]):
+        os.remove(state["archive"])
+    if merged_video_path is None:
+        await cb.message.edit("❌ Failed to merge video !")
+        await cleanupJob(cb.from_user.id, job_id)
+        return
+    try:
+        await cb.message.edit("✅ Sucessfully Merged Video !")
+    except MessageNotModified:
+        await cb.message.edit("Sucessfully Merged Video ! ✅")
+    LOGGER.info(f"Video merged for: {cb.from_user.first_name} ")
+    await asyncio.sleep(3)
+    extra_outputs = await completeTeeOutputs(merged_video_path, formats[1:])
+    await uploadMerged(
+        c, cb, omess, merged_video_path, new_file_name, job_id, [], extra_outputs
+    )
+    return
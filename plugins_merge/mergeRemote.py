@@ -0,0 +1,193 @@
+import asyncio
+import os
+
+from __init__ import LOGGER, driveDB
+from helpers import database
+from helpers.ffmpeg_helper import MergeRemoteStream, completeTeeOutputs
+from helpers.metadata import userMetadata
+from helpers.rclone_upload import rcloneList
+from helpers.utils import UserSettings, get_readable_file_size
+from helpers.workspace import cleanupJob
+from plugins.uploadMerged import uploadMerged
+from pyrogram import Client
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import (CallbackQuery, InlineKeyboardButton,
+                            InlineKeyboardMarkup, Message)
+
+PAGE_SIZE = 8
+
+
+async def getRcloneConfig(c: Client, uid: int):
+    """
+    returns: Path of the user's rclone config, or `None` if there is none.
+    """
+    conf_path = f"userdata/{uid}/rclone.conf"
+    if not os.path.exists(conf_path):
+        try:
+            urc = await database.getUserRcloneConfig(uid)
+            await c.download_media(message=urc, file_name=conf_path)
+        except Exception as err:
+            LOGGER.info(f"No rclone config for {uid}: {err}")
+    return conf_path if os.path.exists(conf_path) else None
+
+
+async def driveBrowse(c: Client, m: Message):
+    conf_path = await getRcloneConfig(c, m.from_user.id)
+    if conf_path is None:
+        await m.reply_text("Rclone not Found, save your rclone.conf first", quote=True)
+        return
+    path = m.text.split(" ", 1)[1].strip("/ ") if len(m.text.split(" ", 1)) > 1 else ""
+    editable = await m.reply_text("📂 Listing drive ...", quote=True)
+    driveDB[m.from_user.id] = {
+        "conf": conf_path,
+        "path": path,
+        "entries": [],
+        "page": 0,
+        "picked": [],
+    }
+    await showDrive(editable, m.from_user.id, reload=True)
+
+
+async def showDrive(editable: Message, uid: int, reload: bool = False):
+    state = driveDB[uid]
+    if reload:
+        entries = await rcloneList(state["conf"], state["path"])
+        if entries is None:
+            await editable.edit(f"❌ Unable to list `/{state['path']}`")
+            return
+        state["entries"] = entries
+        state["page"] = 0
+    picked = [e["Path"] for e in state["picked"]]
+    start = state["page"] * PAGE_SIZE
+    buttons = []
+    for n, e in enumerate(state["entries"][start : start + PAGE_SIZE], start=start):
+        if e["IsDir"]:
+            buttons.append(
+                [InlineKeyboardButton(f"📁 {e['Name']}", callback_data=f"drv_open_{n}")]
+            )
+            continue
+        full = f"{state['path']}/{e['Path']}".strip("/")
+        mark = f"✅ {picked.index(full) + 1}." if full in picked else "🎞"
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    f"{mark} {e['Name']} [{get_readable_file_size(e['Size'])}]",
+                    callback_data=f"drv_pick_{n}",
+                )
+            ]
+        )
+    nav = []
+    if state["page"] > 0:
+        nav.append(InlineKeyboardButton("⬅️", callback_data="drv_page_-1"))
+    if state["path"]:
+        nav.append(InlineKeyboardButton("⬆️ Up", callback_data="drv_up"))
+    if start + PAGE_SIZE < len(state["entries"]):
+        nav.append(InlineKeyboardButton("➡️", callback_data="drv_page_1"))
+    if nav:
+        buttons.append(nav)
+    buttons.append(
+        [
+            InlineKeyboardButton(f"🔀 Merge {len(picked)} files", callback_data="drv_merge"),
+            InlineKeyboardButton("⛔ Cancel ⛔", callback_data="drv_cancel"),
+        ]
+    )
+    try:
+        await editable.edit(
+            text=f"📂 `/{state['path']}`\n\nPick the videos in merge order, they are streamed from the drive while merging.",
+            reply_markup=InlineKeyboardMarkup(buttons),
+        )
+    except MessageNotModified:
+        pass
+
+
+async def driveCallback(c: Client, cb: CallbackQuery):
+    uid = cb.from_user.id
+    state = driveDB.get(uid)
+    if state is None:
+        await cb.answer("Drive session expired, send /drive again", show_alert=True)
+        return
+    action = cb.data.split("_")[1]
+    if action == "open":
+        e = state["entries"][int(cb.data.split("_")[2])]
+        state["path"] = f"{state['path']}/{e['Path']}".strip("/")
+        await showDrive(cb.message, uid, reload=True)
+    elif action == "up":
+        state["path"] = state["path"].rsplit("/", 1)[0] if "/" in state["path"] else ""
+        await showDrive(cb.message, uid, reload=True)
+    elif action == "page":
+        state["page"] += int(cb.data.split("_")[2])
+        await showDrive(cb.message, uid)
+    elif action == "pick":
+        e = state["entries"][int(cb.data.split("_")[2])]
+        full = f"{state['path']}/{e['Path']}".strip("/")
+        picked = [p["Path"] for p in state["picked"]]
+        if full in picked:
+            state["picked"].pop(picked.index(full))
+        else:
+            state["picked"].append({"Path": full, "Name": e["Name"], "Size": e["Size"]})
+        await showDrive(cb.message, uid)
+    elif action == "merge":
+        if len(state["picked"]) < 2:
+            await cb.answer("Pick at least 2 videos", show_alert=True)
+            return
+        state["ready"] = True
+        # same upload and rename choices as a telegram queue
+        await cb.message.edit(
+            text="Where do you want to upload?",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton("📤 To Telegram", callback_data="to_telegram"),
+                        InlineKeyboardButton("🌫️ To Drive", callback_data="to_drive"),
+                    ],
+                    [InlineKeyboardButton("⛔ Cancel ⛔", callback_data="drv_cancel")],
+                ]
+            ),
+        )
+    elif action == "cancel":
+        driveDB.pop(uid, None)
+        await cb.message.edit("Sucessfully Cancelled")
+        await asyncio.sleep(5)
+        await cb.message.delete(True)
+
+
+def hasRemoteJob(uid: int):
+    return driveDB.get(uid, {}).get("ready", False)
+
+
+async def mergeRemote(c: Client, cb: CallbackQuery, new_file_name: str):
+    omess = cb.message.reply_to_message
+    state = driveDB.pop(cb.from_user.id)
+    job_id = cb.message.id
+    await cb.message.edit("⭕ Processing...")
+    user_meta = await userMetadata(cb.from_user.id, cb.from_user.first_name)
+    user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+    formats = user.output_formats.split("+")
+    new_file_name = f"{os.path.splitext(new_file_name)[0]}.{formats[0]}"
+    LOGGER.info(f"Remote merge for user {cb.from_user.id}: {state['picked']}")
+    merged_video_path = await MergeRemoteStream(
+        c=c,
+        conf_path=state["conf"],
+        entries=[(e["Path"], e["Name"], e["Size"]) for e in state["picked"]],
+        user_id=cb.from_user.id,
+        message=cb.message,
+        format_=formats[0],
+        job_id=job_id,
+        metadata=user_meta,
+        extra_formats=formats[1:],
+    )
+    if merged_video_path is None:
+        await cb.message.edit("❌ Failed to merge video !")
+        await cleanupJob(cb.from_user.id, job_id)
+        return
+    try:
+        await cb.message.edit("✅ Sucessfully Merged Video !")
+    except MessageNotModified:
+        await cb.message.edit("Sucessfully Merged Video ! ✅")
+    LOGGER.info(f"Video merged for: {cb.from_user.first_name} ")
+    await asyncio.sleep(3)
+    extra_outputs = await completeTeeOutputs(merged_video_path, formats[1:])
+    await uploadMerged(
+        c, cb, omess, merged_video_path, new_file_name, job_id, [], extra_outputs
+    )
+    return
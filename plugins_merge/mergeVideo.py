@@ -1,21 +1,22 @@
 import asyncio
 import os
-import time
 
-from bot import (LOGGER, UPLOAD_AS_DOC, UPLOAD_TO_DRIVE, delete_all, formatDB,
-                 gDict, queueDB)
+from bot import LOGGER, gDict
 from config import Config
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
-from helpers.display_progress import Progress
-from helpers.ffmpeg_helper import MergeSub, MergeVideo, take_screen_shot
-from helpers.rclone_upload import rclone_driver, rclone_upload
-from helpers.uploader import uploadVideo
+from helpers.downloader import (cancelPrefetch, downloadAll, queuePath,
+                                uniqueMedia)
+from helpers.compat import planConcat
+from helpers.planner import jobPlanDB
+from helpers.ffmpeg_helper import (MergeVideo, MergeVideoFilter, MergeVideoStream,
+                                   NormalizeVideo, completeTeeOutputs)
+from helpers.metadata import userMetadata
+from helpers.rclone_upload import rclone_upload
+from helpers.subtitles import combineSubtitles
 from helpers.utils import UserSettings
-from PIL import Image
+from helpers.workspace import cleanupJob, jobDir, queueIds, takeQueue
+from plugins.uploadMerged import uploadMerged
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
-from pyrogram.errors.rpc_error import UnknownError
 from pyrogram.types import CallbackQuery
 
 
@@ -23,13 +24,20 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
     omess = cb.message.reply_to_message
     # LOGGER.info(omess.id)
     vid_list = list()
+    file_list = list()
     sub_list = list()
-    sIndex = 0
     await cb.message.edit("⭕ Processing...")
-    duration = 0
-    list_message_ids = queueDB.get(cb.from_user.id)["videos"]
-    list_message_ids.sort()
-    list_subtitle_ids = queueDB.get(cb.from_user.id)["subtitles"]
+    # the queue now belongs to this job, the user can start the next one
+    queue = takeQueue(cb.from_user.id)
+    job_inputs = queueIds(queue)
+    job_id = cb.message.id
+    user_meta = await userMetadata(cb.from_user.id, cb.from_user.first_name)
+    # every container comes out of the same mux, first one is the main output
+    user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+    formats = user.output_formats.split("+")
+    new_file_name = f"{os.path.splitext(new_file_name)[0]}.{formats[0]}"
+    list_message_ids = queue["videos"]
+    list_subtitle_ids = queue["subtitles"]
     # list_subtitle_ids.sort()
     LOGGER.info(Config.IS_PREMIUM)
     LOGGER.info(f"Videos: {list_message_ids}")
@@ -38,88 +46,104 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
         await cb.answer("Queue Empty", show_alert=True)
         await cb.message.delete(True)
         return
-    if not os.path.exists(f"downloads/{str(cb.from_user.id)}/"):
-        os.makedirs(f"downloads/{str(cb.from_user.id)}/")
-    input_ = f"downloads/{str(cb.from_user.id)}/input.txt"
-    all = len(list_message_ids)
-    n=1
-    for i in await c.get_messages(
-chat_id=cb.from_user.id, message_ids=list_message_ids ):
-        media = i.video or i.document
-        await cb.message.edit(f"📥 Starting Download of ... `{media.file_name}`")
-        LOGGER.info(f"📥 Starting Download of ... {media.file_name}")
-        await asyncio.sleep(5)
-        file_dl_path = None
-        sub_dl_path = None
-        try:
-            c_time = time.time()
-            prog = Progress(cb.from_user.id, c, cb.message)
-            file_dl_path = await c.download_media(
-                message=media,
-                file_name=f"downloads/{str(cb.from_user.id)}/{str(i.id)}/vid.mkv",  # fix for filename with single quote(') in name
-                progress=prog.progress_for_pyrogram,
-                progress_args=(f"🚀 Downloading: `{media.file_name}`", c_time, f"\n**Downloading: {n}/{all}**"),
-            )
-            n+=1
-            if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
-                return
-            await cb.message.edit(f"Downloaded Sucessfully ... `{media.file_name}`")
-            LOGGER.info(f"Downloaded Sucessfully ... {media.file_name}")
-            await asyncio.sleep(5)
-        except UnknownError as e:
-            LOGGER.info(e)
-            pass
-        except Exception as downloadErr:
-            LOGGER.info(f"Failed to download Error: {downloadErr}")
-            queueDB.get(cb.from_user.id)["video"].remove(i.id)
-            await cb.message.edit("❗File Skipped!")
-            await asyncio.sleep(4)
-            continue
+    input_ = f"{jobDir(cb.from_user.id, job_id)}/input.txt"
+    # keep each video paired with its subtitle before sorting the queue
+    sub_for = dict(zip(list_message_ids, list_subtitle_ids))
+    list_message_ids.sort()
+    msgs = await c.get_messages(chat_id=cb.from_user.id, message_ids=list_message_ids)
+    msgs = uniqueMedia(msgs)
+    sub_ids = [sub_for.get(i.id) for i in msgs if sub_for.get(i.id) is not None]
+    subs = {}
+    if sub_ids:
+        for s in await c.get_messages(chat_id=cb.from_user.id, message_ids=sub_ids):
+            subs[s.id] = s
+    job_plan = jobPlanDB.pop(cb.from_user.id, None)
+    streamed = Config.STREAM_MERGE or (job_plan is not None and job_plan.streamed)
+    if streamed and not sub_ids:
+        # the plan counted on the inputs never touching the disk
+        cancelPrefetch(cb.from_user.id)
+        LOGGER.info(f"Streaming merge for user {cb.from_user.id}")
+        merged_video_path = await MergeVideoStream(
+            c=c,
+            messages=msgs,
+            user_id=cb.from_user.id,
+            message=cb.message,
+            format_=formats[0],
+            job_id=job_id,
+            metadata=user_meta,
+            extra_formats=formats[1:],
+        )
+    else:
+        items = [(i, queuePath(cb.from_user.id, i)) for i in msgs]
+        items += [(s, queuePath(cb.from_user.id, s)) for s in subs.values()]
+        await cb.message.edit(f"📥 Starting Download of {len(items)} files ...")
+        paths = await downloadAll(c, cb, items)
+        if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
+            await cleanupJob(cb.from_user.id, job_id, job_inputs)
+            return
+        dl_paths = dict(zip([m.id for m, _ in items], paths))
+
+        for i in msgs:
+            file_dl_path = dl_paths.get(i.id)
+            if file_dl_path is None:
+                queue["videos"].remove(i.id)
+                await cb.message.edit(f"❗File Skipped! `{(i.video or i.document).file_name}`")
+                continue
+            sub_list.append(dl_paths.get(sub_for.get(i.id)))
+            file_list.append(file_dl_path)
+            vid_list.append(f"file '{file_dl_path}'")
 
-        if list_subtitle_ids[sIndex] is not None:
-            a = await c.get_messages(
-                chat_id=cb.from_user.id, message_ids=list_subtitle_ids[sIndex]
+        LOGGER.info(f"Trying to merge videos user {cb.from_user.id}")
+        await cb.message.edit(f"🔀 Trying to merge videos ...")
+        plan = await planConcat(file_list) if file_list else {"mode": "copy"}
+        if plan["mode"] == "normalize":
+            # re-encode only the odd episodes so the rest can still be stream copied
+            await cb.message.edit(
+                f"🛠 Re-encoding {len(plan['outliers'])} mismatched videos ..."
             )
-            sub_dl_path = await c.download_media(
-                message=a,
-                file_name=f"downloads/{str(cb.from_user.id)}/{str(a.id)}/",
+            for n in plan["outliers"]:
+                normalized = await NormalizeVideo(
+                    file_list[n], plan, f"{os.path.dirname(file_list[n])}/norm.mkv"
+                )
+                if normalized is None:
+                    plan["mode"] = "filter"
+                    break
+                file_list[n] = normalized
+                vid_list[n] = f"file '{normalized}'"
+        with open(input_, "w") as _list:
+            _list.write("\n".join(vid_list))
+        subtitle_file = None
+        if any(sub_list):
+            # one combined track instead of remuxing every subtitled episode
+            subtitle_file = await combineSubtitles(
+                sub_list, file_list, f"{jobDir(cb.from_user.id, job_id)}/merged_subs"
             )
-            LOGGER.info("Got sub: ", a.document.file_name)
-            file_dl_path = await MergeSub(file_dl_path, sub_dl_path, cb.from_user.id)
-            LOGGER.info("Added subs")
-        sIndex += 1
-
-        metadata = extractMetadata(createParser(file_dl_path))
-        try:
-            if metadata.has("duration"):
-                duration += metadata.get("duration").seconds
-            vid_list.append(f"file '{file_dl_path}'")
-        except:
-            await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-            queueDB.update(
-                {cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}}
+        if plan["mode"] == "filter":
+            merged_video_path = await MergeVideoFilter(
+                file_list=file_list,
+                user_id=cb.from_user.id,
+                message=cb.message,
+                format_=formats[0],
+                plan=plan,
+                subtitle_file=subtitle_file,
+                job_id=job_id,
+                metadata=user_meta,
+                extra_formats=formats[1:],
+            )
+        else:
+            merged_video_path = await MergeVideo(
+                input_file=input_,
+                user_id=cb.from_user.id,
+                message=cb.message,
+                format_=formats[0],
+                subtitle_file=subtitle_file,
+                job_id=job_id,
+                metadata=user_meta,
+                extra_formats=formats[1:],
             )
-            formatDB.update({cb.from_user.id: None})
-            await cb.message.edit("⚠️ Video is corrupted")
-            return
-
-    _cache = list()
-    for i in range(len(vid_list)):
-        if vid_list[i] not in _cache:
-            _cache.append(vid_list[i])
-    vid_list = _cache
-    LOGGER.info(f"Trying to merge videos user {cb.from_user.id}")
-    await cb.message.edit(f"🔀 Trying to merge videos ...")
-    with open(input_, "w") as _list:
-        _list.write("\n".join(vid_list))
-    merged_video_path = await MergeVideo(
-        input_file=input_, user_id=cb.from_user.id, message=cb.message, format_="mkv"
-    )
     if merged_video_path is None:
         await cb.message.edit("❌ Failed to merge video !")
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
         return
     try:
         await cb.message.edit("✅ Sucessfully Merged Video !")
@@ -127,92 +151,9 @@ chat_id=cb.from_user.id, message_ids=list_message_ids ):
         await cb.message.edit("Sucessfully Merged Video ! ✅")
     LOGGER.info(f"Video merged for: {cb.from_user.first_name} ")
     await asyncio.sleep(3)
-    file_size = os.path.getsize(merged_video_path)
-    os.rename(merged_video_path, new_file_name)
-    await cb.message.edit(
-        f"🔄 Renamed Merged Video to\n **{new_file_name.rsplit('/',1)[-1]}**"
-    )
-    await asyncio.sleep(3)
-    merged_video_path = new_file_name
-    if UPLOAD_TO_DRIVE[f"{cb.from_user.id}"]:
-        await rclone_driver(omess, cb, merged_video_path)
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        return
-    if file_size > 2044723200 and Config.IS_PREMIUM == False:
-        await cb.message.edit(
-            f"Video is Larger than 2GB Can't Upload,\n\n Tell {Config.OWNER_USERNAME} to add premium account to get 4GB TG uploads"
-        )
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        return
-    if Config.IS_PREMIUM and file_size > 4241280205:
-        await cb.message.edit(
-            f"Video is Larger than 4GB Can't Upload,\n\n Tell {Config.OWNER_USERNAME} to die with premium account"
-        )
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        return
-    await cb.message.edit("🎥 Extracting Video Data ...")
-    duration = 1
-    try:
-        metadata = extractMetadata(createParser(merged_video_path))
-        if metadata.has("duration"):
-            duration = metadata.get("duration").seconds
-    except Exception as er:
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        await cb.message.edit("⭕ Merged Video is corrupted")
-        return
-    try:
-        user = UserSettings(cb.from_user.id, cb.from_user.first_name)
-        thumb_id = user.thumbnail
-        if thumb_id is None:
-            raise Exception
-        # thumb_id = await database.getThumb(cb.from_user.id)
-        video_thumbnail = f"downloads/{str(cb.from_user.id)}_thumb.jpg"
-        await c.download_media(message=str(thumb_id), file_name=video_thumbnail)
-    except Exception as err:
-        LOGGER.info("Generating thumb")
-        video_thumbnail = await take_screen_shot(
-            merged_video_path, f"downloads/{str(cb.from_user.id)}", (duration / 2)
-        )
-    width = 1280
-    height = 720
-    try:
-        thumb = extractMetadata(createParser(video_thumbnail))
-        height = thumb.get("height")
-        width = thumb.get("width")
-        img = Image.open(video_thumbnail)
-        if width > height:
-            img.resize((320, height))
-        elif height > width:
-            img.resize((width, 320))
-        img.save(video_thumbnail)
-        Image.open(video_thumbnail).convert("RGB").save(video_thumbnail, "JPEG")
-    except:
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        await cb.message.edit("⭕ Merged Video is corrupted")
-        return
-    await uploadVideo(
-        c=c,
-        cb=cb,
-        merged_video_path=merged_video_path,
-        width=width,
-        height=height,
-        duration=duration,
-        video_thumbnail=video_thumbnail,
-        file_size=os.path.getsize(merged_video_path),
-        upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
+    # a container that failed inside the tee is skipped, not the whole job
+    extra_outputs = await completeTeeOutputs(merged_video_path, formats[1:])
+    await uploadMerged(
+        c, cb, omess, merged_video_path, new_file_name, job_id, job_inputs, extra_outputs
     )
-    await cb.message.delete(True)
-    await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-    queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-    formatDB.update({cb.from_user.id: None})
     return
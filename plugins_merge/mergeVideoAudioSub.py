@@ -0,0 +1,84 @@
+import asyncio
+
+from bot import LOGGER, gDict
+from helpers.downloader import downloadAll, queuePath, uniqueMedia
+from helpers.ffmpeg_helper import MergeAudioSub
+from helpers.metadata import userMetadata
+from helpers.workspace import cleanupJob, queueIds, takeQueue
+from plugins.uploadMerged import uploadMerged
+from pyrogram import Client
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import CallbackQuery, Message
+
+
+async def mergeAudioSub(c: Client, cb: CallbackQuery, new_file_name: str):
+    omess = cb.message.reply_to_message
+    audio_list = []
+    sub_list = []
+    await cb.message.edit("⭕ Processing...")
+    # the queue now belongs to this job, the user can start the next one
+    queue = takeQueue(cb.from_user.id)
+    job_inputs = queueIds(queue)
+    job_id = cb.message.id
+    if not queue["videos"]:
+        await cb.answer("Queue Empty", show_alert=True)
+        await cb.message.delete(True)
+        return
+    user_meta = await userMetadata(cb.from_user.id, cb.from_user.first_name)
+    video_mess = queue["videos"][0]
+    audio_ids: list = queue["audios"]
+    sub_ids: list = [
+        i for i in queue["subtitles"] if i is not None
+    ]
+    list_message_ids = [video_mess] + audio_ids + sub_ids
+    msgs: list[Message] = await c.get_messages(
+        chat_id=cb.from_user.id, message_ids=list_message_ids
+    )
+    msgs = uniqueMedia(msgs)
+    items = [(i, queuePath(cb.from_user.id, i)) for i in msgs]
+    await cb.message.edit(f"📥 Starting Download of {len(items)} files ...")
+    paths = await downloadAll(c, cb, items)
+    if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    video_path = None
+    for i, file_dl_path in zip(msgs, paths):
+        if file_dl_path is None:
+            for key in ("audios", "subtitles"):
+                if i.id in queue[key]:
+                    queue[key].remove(i.id)
+            await cb.message.edit(f"❗File Skipped! `{(i.video or i.document or i.audio).file_name}`")
+            continue
+        if i.id == video_mess:
+            video_path = file_dl_path
+        elif i.id in audio_ids:
+            audio_list.append(f"{file_dl_path}")
+        else:
+            sub_list.append(f"{file_dl_path}")
+    if video_path is None:
+        await cb.message.edit("❌ Failed to download video !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+
+    # one read and one write of the video for both audio and subtitle tracks
+    muxed_video = await MergeAudioSub(
+        video_path,
+        audio_list,
+        sub_list,
+        cb.from_user.id,
+        job_id=job_id,
+        metadata=user_meta,
+        message=cb.message,
+    )
+    if muxed_video is None:
+        await cb.message.edit("❌ Failed to add audio and subs to video !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    try:
+        await cb.message.edit("✅ Sucessfully Muxed Video !")
+    except MessageNotModified:
+        await cb.message.edit("Sucessfully Muxed Video ! ✅")
+    LOGGER.info(f"Video muxed for: {cb.from_user.first_name} ")
+    await asyncio.sleep(3)
+    await uploadMerged(c, cb, omess, muxed_video, new_file_name, job_id, job_inputs)
+    return
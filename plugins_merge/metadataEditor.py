@@ -3,8 +3,41 @@
 
 from pyrogram import Client
 from pyrogram.types import Message
-from bot import mergeApp, LOGGER
-from config import Config
+from bot import LOGGER
+from helpers import database
+from helpers.metadata import formatMetadata, parseMetadata
+from helpers.utils import UserSettings
 
-async def metaEditor(c:Client, m: Message):
-    1
+USAGE = """
+<b>Usage:</b>
+`/metadata title=My Movie | author=Me | a1.title=English | a1.language=eng | a2.default`
+
+┣ `key=value`: global tag of the file
+┣ `v1.`/`a1.`/`s1.` + `key=value`: tag of video/audio/subtitle track 1
+┣ `a2.default`: make audio track 2 the default one
+┗ `/metadata clear`: remove saved metadata
+
+Tags are written while merging, no extra pass over the file.
+"""
+
+
+async def metaEditor(c: Client, m: Message):
+    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    text = m.text.split(" ", 1)[1].strip() if len(m.text.split(" ", 1)) > 1 else ""
+    if text.lower() == "clear":
+        await database.delMetadata(m.from_user.id)
+        await m.reply_text("🗑 Metadata removed", quote=True)
+        return
+    if text:
+        meta = parseMetadata(text)
+        await database.saveMetadata(m.from_user.id, meta)
+        user.edit_metadata = True
+        user.set()
+        LOGGER.info(f"Metadata saved for {m.from_user.id}: {meta}")
+    else:
+        meta = await database.getMetadata(m.from_user.id) or {}
+    await m.reply_text(
+        f"**{'✅' if user.edit_metadata else '❌'} Edit Metadata: <u>{user.edit_metadata}</u>**\n\n"
+        f"{formatMetadata(meta)}\n{USAGE}",
+        quote=True,
+    )
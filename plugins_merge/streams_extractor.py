@@ -5,16 +5,17 @@ from pyrogram.types import Message, CallbackQuery
 from pyrogram.errors import MessageNotModified
 from pyrogram.errors.rpc_error import UnknownError
 import asyncio
-from __init__ import LOGGER, gDict, queueDB
+from __init__ import LOGGER, gDict
 import os
-from bot import delete_all
 from helpers.display_progress import Progress
 from helpers.ffmpeg_helper import extractAudios, extractSubtitles
 from helpers.uploader import uploadFiles
+from helpers.workspace import cleanupJob, jobDir
 
 async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=False, exSubs=False):
-    if not os.path.exists(f"downloads/{str(cb.from_user.id)}/"):
-        os.makedirs(f"downloads/{str(cb.from_user.id)}/")
+    # extractions get their own workspace, a merge may be running next to it
+    job_id = cb.message.id
+    workspace = jobDir(cb.from_user.id, job_id)
     _hold = await cb.message.edit(text="Please wait")
     omess:Message = await c.get_messages(chat_id=cb.from_user.id, message_ids=media_mid)
     try:
@@ -31,11 +32,12 @@ async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=Fals
         progress=f"🚀 Downloading: `{media.file_name}`"
         file_dl_path = await c.download_media(
             message=media,
-            file_name=f"downloads/{str(cb.from_user.id)}/{str(omess.id)}/vid.mkv",  # fix for filename with single quote(') in name
+            file_name=f"{workspace}/{str(omess.id)}/vid.mkv",  # fix for filename with single quote(') in name
             progress=prog.progress_for_pyrogram,
             progress_args=(progress, c_time),
         )
         if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
+            await cleanupJob(cb.from_user.id, job_id)
             return
         await cb.message.edit(f"Downloaded Sucessfully ... `{media.file_name}`")
         LOGGER.info(f"Downloaded Sucessfully ... {media.file_name}")
@@ -51,15 +53,14 @@ async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=Fals
     await asyncio.sleep(3)
     if exAudios:
         await _hold.edit_text("Extracting Audios")
-        extract_dir = await extractAudios(file_dl_path,cb.from_user.id)
+        extract_dir = await extractAudios(file_dl_path, cb.from_user.id, job_id)
     if exSubs:
         await _hold.edit_text("Extracting Subtitles")
-        extract_dir = await extractSubtitles(file_dl_path, cb.from_user.id)
+        extract_dir = await extractSubtitles(file_dl_path, cb.from_user.id, job_id)
 
     if extract_dir is None:
         await cb.message.edit("❌ Failed to Extract Streams !")
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
+        await cleanupJob(cb.from_user.id, job_id)
         return
 
     for dirpath, dirnames, filenames in os.walk(extract_dir):
@@ -78,7 +79,6 @@ async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=Fals
             cf+=1
             LOGGER.info(f"Uploaded: {up_path}")
     await cb.message.delete()
-    await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-    queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
+    await cleanupJob(cb.from_user.id, job_id)
     
     return
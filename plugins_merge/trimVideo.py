@@ -0,0 +1,82 @@
+import asyncio
+
+from __init__ import queueDB
+from bot import LOGGER, gDict
+from helpers.downloader import downloadAll, queuePath
+from helpers.ffmpeg_helper import SmartCut
+from helpers.metadata import userMetadata
+from helpers.utils import parse_ranges
+from helpers.workspace import cleanupJob, queueIds, takeQueue
+from plugins.uploadMerged import uploadMerged
+from pyrogram import Client, filters
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import CallbackQuery, Message
+
+
+async def trimNow(c: Client, cb: CallbackQuery, new_file_name: str):
+    omess = cb.message.reply_to_message
+    queued = (queueDB.get(cb.from_user.id) or {}).get("videos") or []
+    if len(queued) > 1:
+        # leave the queue alone so nothing the user sent is thrown away
+        await cb.answer(
+            f"Trim works on one video, you have {len(queued)} queued. Clear the queue and send just one.",
+            show_alert=True,
+        )
+        return
+    # the queue now belongs to this job, the user can start the next one
+    queue = takeQueue(cb.from_user.id)
+    job_inputs = queueIds(queue)
+    job_id = cb.message.id
+    if not queue["videos"]:
+        await cb.answer("Queue Empty", show_alert=True)
+        await cb.message.delete(True)
+        return
+    await cb.message.edit(
+        "✂️ Send me the parts to keep, like `0:30-2:30, 10:00-12:15`\n\nYou have 2 minutes"
+    )
+    try:
+        res: Message = await c.listen(
+            (cb.message.chat.id, None, None), filters=filters.text, timeout=120
+        )
+    except Exception:
+        await cb.message.edit("❌ No ranges received, trim cancelled")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    ranges = parse_ranges(res.text)
+    await res.delete(True)
+    if ranges is None:
+        await cb.message.edit("❌ Couldn't read those ranges, trim cancelled")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    user_meta = await userMetadata(cb.from_user.id, cb.from_user.first_name)
+    video_mess = queue["videos"][0]
+    i: Message = await c.get_messages(chat_id=cb.from_user.id, message_ids=video_mess)
+    await cb.message.edit(f"📥 Starting Download of ... `{(i.video or i.document).file_name}`")
+    paths = await downloadAll(c, cb, [(i, queuePath(cb.from_user.id, i))])
+    if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    if paths[0] is None:
+        await cb.message.edit("❌ Failed to download video !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    trimmed_video = await SmartCut(
+        paths[0],
+        ranges,
+        cb.from_user.id,
+        cb.message,
+        job_id=job_id,
+        metadata=user_meta,
+    )
+    if trimmed_video is None:
+        await cb.message.edit("❌ Failed to trim video !")
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    try:
+        await cb.message.edit("✅ Sucessfully Trimmed Video !")
+    except MessageNotModified:
+        await cb.message.edit("Sucessfully Trimmed Video ! ✅")
+    LOGGER.info(f"Video trimmed for: {cb.from_user.first_name} ")
+    await asyncio.sleep(3)
+    await uploadMerged(c, cb, omess, trimmed_video, new_file_name, job_id, job_inputs)
+    return
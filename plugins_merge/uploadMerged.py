@@ -0,0 +1,146 @@
+import os
+
+from bot import LOGGER, UPLOAD_AS_DOC, UPLOAD_TO_DRIVE
+from helpers.encoder import FitToSize, copiedStreamBytes
+from helpers.ffmpeg_helper import take_screen_shot
+from helpers.media_info import mediaInfo
+from helpers.probe import probeMedia
+from helpers.rclone_upload import rclone_driver
+from helpers.splitter import splitVideo, uploadLimit
+from helpers.uploader import uploadVideo
+from helpers.utils import UserSettings
+from helpers.workspace import cleanupJob, jobDir
+from PIL import Image
+from pyrogram import Client
+from pyrogram.types import CallbackQuery, Message
+
+
+async def fitUploadLimit(cb: CallbackQuery, user: UserSettings, path: str, duration: int):
+    """
+    Makes a finished file uploadable: re-encodes it to fit if the user asked
+    for that, else splits it at keyframes.
+
+    Parameters:
+    - `duration`: Duration the upload already read, not probed again.
+
+    returns: Paths to upload in order, or `None` if splitting failed.
+    """
+    file_size = os.path.getsize(path)
+    if file_size > uploadLimit() and user.fit_to_size:
+        # only the track list is read here, the duration is the upload's
+        copied = copiedStreamBytes(await probeMedia(path) or {}, duration)
+        fitted = await FitToSize(cb, path, duration, copied, uploadLimit())
+        if fitted is not None:
+            os.replace(fitted, path)
+            file_size = os.path.getsize(path)
+        else:
+            await cb.message.edit("❗ Couldn't fit video in one file, splitting instead ...")
+    if file_size <= uploadLimit():
+        return [path]
+    await cb.message.edit(
+        f"✂️ Video is larger than {round(uploadLimit() / 1024**3, 2)}GB, splitting it into parts ..."
+    )
+    parts = await splitVideo(path, uploadLimit())
+    if parts is not None:
+        os.remove(path)
+    return parts
+
+
+async def uploadMerged(
+    c: Client,
+    cb: CallbackQuery,
+    omess: Message,
+    merged_video_path: str,
+    new_file_name: str,
+    job_id: int,
+    job_inputs: list,
+    extra_outputs: list = [],
+):
+    """
+    Shared last steps of every merge mode: rename, upload to drive or
+    telegram (splitting files over the upload limit), then clean up.
+
+    Parameters:
+    - `job_id`: Job whose workspace is removed at the end.
+    - `job_inputs`: Queued message ids the job downloaded.
+    - `extra_outputs`: Same video in other containers, uploaded next to it.
+    """
+    workspace = jobDir(cb.from_user.id, job_id)
+    os.rename(merged_video_path, new_file_name)
+    await cb.message.edit(
+        f"🔄 Renamed Merged Video to\n **{new_file_name.rsplit('/',1)[-1]}**"
+    )
+    merged_video_path = new_file_name
+    outputs = [merged_video_path]
+    for extra in extra_outputs:
+        # other containers keep the chosen name with their own extension
+        renamed = os.path.splitext(new_file_name)[0] + os.path.splitext(extra)[1]
+        os.rename(extra, renamed)
+        outputs.append(renamed)
+    if UPLOAD_TO_DRIVE[f"{cb.from_user.id}"]:
+        for output in outputs:
+            await rclone_driver(omess, cb, output)
+        await cleanupJob(cb.from_user.id, job_id, job_inputs)
+        return
+    await cb.message.edit("🎥 Extracting Video Data ...")
+    info = await mediaInfo(merged_video_path)
+    # an unknown duration only costs the seek bar, not the upload
+    duration = max(int(info.duration), 1)
+    user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+    try:
+        thumb_id = user.thumbnail
+        if thumb_id is None:
+            raise Exception
+        video_thumbnail = f"{workspace}/thumb.jpg"
+        await c.download_media(message=str(thumb_id), file_name=video_thumbnail)
+    except Exception:
+        LOGGER.info("Generating thumb")
+        video_thumbnail = await take_screen_shot(
+            merged_video_path, workspace, (duration / 2)
+        )
+    width = info.width or 1280
+    height = info.height or 720
+    try:
+        img = Image.open(video_thumbnail)
+        thumb_width, thumb_height = img.size
+        if thumb_width > thumb_height:
+            img.resize((320, thumb_height))
+        elif thumb_height > thumb_width:
+            img.resize((thumb_width, 320))
+        img.save(video_thumbnail)
+        Image.open(video_thumbnail).convert("RGB").save(video_thumbnail, "JPEG")
+    except Exception as err:
+        # telegram makes its own thumbnail, no reason to fail the upload
+        LOGGER.info(f"Uploading without thumbnail: {err}")
+        video_thumbnail = None
+    parts = []
+    for output in outputs:
+        output_parts = await fitUploadLimit(cb, user, output, duration)
+        if output_parts is None:
+            await cb.message.edit("❌ Failed to split video !")
+            await cleanupJob(cb.from_user.id, job_id, job_inputs)
+            return
+        parts += output_parts
+    durations = [
+        duration
+        if p in outputs
+        else int((await mediaInfo(p)).duration)
+        for p in parts
+    ]
+    # one at a time, parts reach the chat in order and each upload owns
+    # the status message while it runs
+    for p, d in zip(parts, durations):
+        await uploadVideo(
+            c=c,
+            cb=cb,
+            merged_video_path=p,
+            width=width,
+            height=height,
+            duration=d,
+            video_thumbnail=video_thumbnail,
+            file_size=os.path.getsize(p),
+            upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
+        )
+    await cb.message.delete(True)
+    await cleanupJob(cb.from_user.id, job_id, job_inputs)
+    return
@@ -1,4 +1,5 @@
 import time
+from config import Config
 from pyrogram import filters, Client as mergeApp
 from pyrogram.types import Message, InlineKeyboardMarkup
 from helpers.msg_utils import MakeButtons
@@ -36,10 +37,26 @@ async def userSettings(
         elif usettings.merge_mode == 4:
             userMergeModeId = 4
             userMergeModeStr = "Extract" 
+        elif usettings.merge_mode == 5:
+            userMergeModeId = 5
+            userMergeModeStr = "Video 🎥 + Audio 🎵 + Subtitle 📜"
+        elif usettings.merge_mode == 6:
+            userMergeModeId = 6
+            userMergeModeStr = "Compress 🗜️"
+        elif usettings.merge_mode == 7:
+            userMergeModeId = 7
+            userMergeModeStr = "Trim ✂️"
         if usettings.edit_metadata:
             editMetadataStr = "✅"
         else:
             editMetadataStr = "❌"
+        fitToSizeStr = "✅" if usettings.fit_to_size else "❌"
+        audioSyncStr = "✅" if usettings.audio_sync else "❌"
+        if usettings.output_formats in Config.OUTPUT_FORMATS:
+            formatId = Config.OUTPUT_FORMATS.index(usettings.output_formats)
+        else:
+            formatId = 0
+        nextFormat = Config.OUTPUT_FORMATS[(formatId + 1) % len(Config.OUTPUT_FORMATS)]
         uSettingsMessage = f"""
 <b><u>Merge Bot settings for <a href='tg://user?id={uid}'>{fname} {lname}</a></u></b>
     ┃
@@ -47,6 +64,9 @@ async def userSettings(
     ┣**{'🚫' if usettings.banned else '🫡'} Ban Status: <u>{usettings.banned}</u>**
     ┣**{'⚡' if usettings.allowed else '❗'} Allowed: <u>{usettings.allowed}</u>**
     ┣**{'✅' if usettings.edit_metadata else '❌'} Edit Metadata: <u>{usettings.edit_metadata}</u>**
+    ┣**{'✅' if usettings.fit_to_size else '❌'} Fit to size: <u>{usettings.fit_to_size}</u>**
+    ┣**📦 Output formats: <u>{usettings.output_formats}</u>**
+    ┣**{'✅' if usettings.audio_sync else '❌'} Auto sync audio: <u>{usettings.audio_sync}</u>**
     ┗**Ⓜ️ Merge mode: <u>{userMergeModeStr}</u>**
 """
         markup = b.makebuttons(
@@ -55,13 +75,25 @@ async def userSettings(
                 userMergeModeStr,
                 "Edit Metadata",
                 editMetadataStr,
+                "Fit to size",
+                fitToSizeStr,
+                "Output formats",
+                usettings.output_formats,
+                "Auto sync audio",
+                audioSyncStr,
                 "Close",
             ],
             [
                 "tryotherbutton",
-                f"ch@ng3M0de_{uid}_{(userMergeModeId%4)+1}",
+                f"ch@ng3M0de_{uid}_{(userMergeModeId%len(Config.MODES))+1}",
                 "tryotherbutton",
                 f"toggleEdit_{uid}",
+                "tryotherbutton",
+                f"toggleFit_{uid}",
+                "tryotherbutton",
+                f"chFormats_{uid}_{nextFormat}",
+                "tryotherbutton",
+                f"toggleSync_{uid}",
                 "close",
             ],
             rows=2,
@@ -74,6 +106,9 @@ async def userSettings(
         usettings.merge_mode = 1
         usettings.allowed = False
         usettings.edit_metadata = False
+        usettings.fit_to_size = False
+        usettings.output_formats = "mkv"
+        usettings.audio_sync = False
         usettings.thumbnail = None
         await userSettings(editable, uid, fname, lname, usettings)
     # await asyncio.sleep(10)
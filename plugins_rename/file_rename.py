@@ -2,11 +2,10 @@ from pyrogram import Client, filters
 from pyrogram.enums import MessageMediaType
 from pyrogram.errors import FloodWait
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
-from hachoir.metadata import extractMetadata
 from helper.ffmpeg import fix_thumb, take_screen_shot, add_metadata
-from hachoir.parser import createParser
 from helper.utils import progress_for_pyrogram, convert, humanbytes, add_prefix_suffix
 from helper.database import jishubotz
+from helpers.media_info import mediaInfo
 from asyncio import sleep
 from PIL import Image
 from config import Config
@@ -116,20 +115,13 @@ async def doc(bot, update):
     else:
         await ms.edit("⏳ Mmm~ Changing modes... Be gentle, won’t you? ⚡")
 
-    duration = 0
-    try:
-        parser = createParser(file_path)
-        metadata = extractMetadata(parser)
-        if metadata.has("duration"):
-            duration = metadata.get('duration').seconds
-        parser.close()   
-    except:
-        pass
-        
+    media = getattr(file, file.media.value)
+    # telegram already knows the duration of most media, no need to parse the file
+    duration = int((await mediaInfo(file_path, media)).duration)
+
     ph_path = None
     user_id = int(update.message.chat.id) 
     user_name = update.message.chat.first_name
-    media = getattr(file, file.media.value)
     c_caption = await jishubotz.get_caption(update.message.chat.id)
     c_thumb = await jishubotz.get_thumbnail(update.message.chat.id)
 
@@ -0,0 +1,64 @@
+"""
+Compares the probe backends on the same files, every probe cold:
+
+    python3 probe_bench.py [-n RUNS] FILE [FILE ...]
+
+Prints the median and best time of each backend per file, and any key
+where their summaries disagree.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from helpers.probe import _ffprobe, _pyav_summary, av
+
+
+async def _pyav(path: str):
+    # no ffprobe fallback here, a failure should show up as one
+    return await asyncio.get_event_loop().run_in_executor(None, _pyav_summary, path)
+
+
+def _differences(a: dict, b: dict):
+    diffs = []
+    for key in sorted(set(a["format"]) | set(b["format"])):
+        if a["format"].get(key) != b["format"].get(key):
+            diffs.append(f"format.{key}: {a['format'].get(key)!r} != {b['format'].get(key)!r}")
+    if len(a["streams"]) != len(b["streams"]):
+        diffs.append(f"streams: {len(a['streams'])} != {len(b['streams'])}")
+    for sa, sb in zip(a["streams"], b["streams"]):
+        for key in sorted(set(sa) | set(sb)):
+            if sa.get(key) != sb.get(key):
+                diffs.append(f"stream {sa.get('index')}.{key}: {sa.get(key)!r} != {sb.get(key)!r}")
+    return diffs
+
+
+async def bench(paths: list, runs: int):
+    backends = {"ffprobe": _ffprobe}
+    if av is not None:
+        backends["pyav"] = _pyav
+    else:
+        print("PyAV isn't installed, timing ffprobe only")
+    for path in paths:
+        summaries = {}
+        for name, probe in backends.items():
+            times = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                summaries[name] = await probe(path)
+                times.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{name:>8}: {statistics.median(times):7.1f} ms median, "
+                f"{min(times):7.1f} ms best  {path}"
+            )
+        if len(summaries) == 2 and None not in summaries.values():
+            for diff in _differences(summaries["ffprobe"], summaries["pyav"]):
+                print(f"          ffprobe/pyav differ at {diff}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time ffprobe against PyAV probing")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="probes per file and backend")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    asyncio.run(bench(args.files, args.runs))